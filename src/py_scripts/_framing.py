@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Length-prefix framing primitives for the camera protocol.
+Fully typed and free of dynamic features so it can be compiled to C
+with mypyc (mypyc _framing.py); the pure-Python module works unchanged.
+"""
+
+import socket
+from typing import Final, Union
+
+HEADER_SIZE: Final = 4  # Big-endian payload length ahead of every frame
+
+
+def pack_header(length: int) -> bytes:
+    """Encode a payload length as a frame header."""
+    return length.to_bytes(HEADER_SIZE, byteorder='big')
+
+
+def unpack_header(buf: Union[bytes, bytearray]) -> int:
+    """Decode the payload length from the start of a frame."""
+    return int.from_bytes(buf[:HEADER_SIZE], byteorder='big')
+
+
+def recv_exact_into(sock: socket.socket, view: memoryview) -> bool:
+    """Fill 'view' completely from socket. False if the peer closed first."""
+    size: int = len(view)
+    received: int = 0
+    while received < size:
+        n: int = sock.recv_into(view[received:])
+        if not n:
+            return False
+        received += n
+    return True
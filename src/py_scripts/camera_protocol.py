@@ -5,11 +5,36 @@ Handles message formatting, parsing, and protocol constants.
 """
 
 import json
+import os
+import queue
 import socket
-from typing import Dict, Any, Optional, Tuple
+import time
+from typing import Dict, Any, List, Optional, Tuple, Union
 from dataclasses import dataclass
 from enum import Enum
 
+# Framing hot path; a mypyc-compiled build is picked up transparently
+from _framing import HEADER_SIZE, pack_header, recv_exact_into, unpack_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Wire codec: orjson when available, stdlib json otherwise. Both produce
+# the same JSON on the wire, so mixed peers interoperate.
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+    
+    def _loads(data: Union[bytes, memoryview]) -> Any:
+        # json.loads() rejects memoryviews of pooled buffers
+        return json.loads(bytes(data))
+
 
 class MessageType(Enum):
     """Message types for camera protocol."""
@@ -21,6 +46,7 @@ class MessageType(Enum):
     RESPONSE = "RESPONSE"
     ERROR = "ERROR"
     HEARTBEAT = "HEARTBEAT"
+    SEND_IMAGE = "SEND_IMAGE"
 
 
 @dataclass
@@ -28,36 +54,90 @@ class ProtocolConfig:
     """Protocol configuration constants."""
     BUFFER_SIZE: int = 4096
     TIMEOUT: int = 10
+    IDLE_TIMEOUT: int = 300  # Seconds an idle persistent command connection is kept open
     HEARTBEAT_INTERVAL: int = 30
     MAX_RETRIES: int = 3
+    FILE_CHUNK_SIZE: int = 65536
+    # Hard cap on a single frame, checked before any buffer is allocated.
+    # Large enough for LIST_IMAGES responses with tens of thousands of files.
+    MAX_MESSAGE_SIZE: int = 4 * 1024 * 1024
+    # Framing buffers kept for reuse; larger frames get a one-off buffer
+    POOL_BUFFER_SIZE: int = 8192
+    BUFFER_POOL_SIZE: int = 16
+
+
+# Options applied to every camera TCP socket: (level, option, value).
+# Commands and responses are tiny, so Nagle's algorithm only adds latency;
+# keepalive detects half-open connections after a Pi reboots.
+#
+# SO_RCVBUF/SO_SNDBUF are deliberately not set here: on Linux an explicit
+# size disables buffer auto-tuning and caps the TCP window. For high-latency
+# links prefer raising net.ipv4.tcp_rmem/tcp_wmem, or append
+# socket_buffer_options() where a fixed size is really wanted.
+DEFAULT_SOCKET_OPTIONS: List[Tuple[int, int, int]] = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+
+def socket_buffer_options(size: int) -> List[Tuple[int, int, int]]:
+    """Socket options that fix both kernel buffers to 'size' bytes."""
+    return [
+        (socket.SOL_SOCKET, socket.SO_RCVBUF, size),
+        (socket.SOL_SOCKET, socket.SO_SNDBUF, size),
+    ]
+
+
+def configure_socket(sock: socket.socket, socket_options: List[Tuple[int, int, int]] = None) -> None:
+    """Apply socket options to a connected camera socket."""
+    for level, option, value in (socket_options or DEFAULT_SOCKET_OPTIONS):
+        sock.setsockopt(level, option, value)
+
+
+# Capture timestamps become image filenames, so nothing else is accepted
+CAPTURE_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+def is_capture_timestamp(value: Any) -> bool:
+    """Check that value is a timestamp in CAPTURE_TIMESTAMP_FORMAT."""
+    if not isinstance(value, str):
+        return False
+    try:
+        time.strptime(value, CAPTURE_TIMESTAMP_FORMAT)
+    except ValueError:
+        return False
+    return True
 
 
 class CameraMessage:
     """Camera protocol message handler."""
     
+    # Wire value -> MessageType, avoids the Enum lookup machinery per message
+    _TYPE_MAP: Dict[str, MessageType] = {t.value: t for t in MessageType}
+    
     def __init__(self, msg_type: MessageType, data: Dict[str, Any] = None):
         self.type = msg_type
         self.data = data or {}
         self.timestamp = None
     
-    def to_json(self) -> str:
-        """Convert message to JSON string."""
-        return json.dumps({
+    def to_bytes(self) -> bytes:
+        """Serialize message to UTF-8 encoded JSON."""
+        return _dumps({
             'type': self.type.value,
             'data': self.data,
             'timestamp': self.timestamp
         })
     
     @classmethod
-    def from_json(cls, json_str: str) -> 'CameraMessage':
-        """Create message from JSON string."""
+    def from_bytes(cls, payload: Union[bytes, memoryview]) -> 'CameraMessage':
+        """Create message from UTF-8 encoded JSON."""
         try:
-            parsed = json.loads(json_str)
-            msg_type = MessageType(parsed['type'])
+            parsed = _loads(payload)
+            msg_type = cls._TYPE_MAP[parsed['type']]
             msg = cls(msg_type, parsed.get('data', {}))
             msg.timestamp = parsed.get('timestamp')
             return msg
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
+        except (KeyError, TypeError, ValueError) as e:
             raise ValueError(f"Invalid message format: {e}")
 
 
@@ -66,15 +146,54 @@ class CameraProtocol:
     
     def __init__(self, config: ProtocolConfig = None):
         self.config = config or ProtocolConfig()
+        
+        # Parameterless commands never change, so encode their frames once
+        self.list_images_frame = self.encode_message(self.create_list_images_message())
+        self.delete_images_frame = self.encode_message(self.create_delete_images_message())
+        self._heartbeat_frames: Dict[str, bytes] = {}  # hostname -> frame
+        # Recycled framing buffers, filled lazily up to BUFFER_POOL_SIZE
+        self._buffers: queue.LifoQueue = queue.LifoQueue(maxsize=self.config.BUFFER_POOL_SIZE)
+    
+    def _acquire_buffer(self, size: int) -> bytearray:
+        """Get a buffer of at least 'size' bytes, from the pool when it fits."""
+        if size > self.config.POOL_BUFFER_SIZE:
+            return bytearray(size)
+        try:
+            return self._buffers.get_nowait()
+        except queue.Empty:
+            return bytearray(self.config.POOL_BUFFER_SIZE)
+    
+    def _release_buffer(self, buf: bytearray) -> None:
+        """Return a pool-sized buffer to the pool, dropping it if the pool is full."""
+        if len(buf) == self.config.POOL_BUFFER_SIZE:
+            try:
+                self._buffers.put_nowait(buf)
+            except queue.Full:
+                pass
+    
+    def encode_message(self, message: CameraMessage) -> bytes:
+        """Encode a message into a length-prefixed wire frame."""
+        payload = message.to_bytes()
+        return pack_header(len(payload)) + payload
     
-    def send_message(self, sock: socket.socket, message: CameraMessage) -> bool:
-        """Send a message through socket."""
+    def send_message(self, sock: socket.socket, message: Union[CameraMessage, bytes]) -> bool:
+        """Send a message, or a frame from encode_message(), through socket."""
         try:
-            json_data = message.to_json()
-            # Send length first, then data
-            length = len(json_data.encode())
-            sock.sendall(length.to_bytes(4, byteorder='big'))
-            sock.sendall(json_data.encode())
+            if isinstance(message, bytes):
+                sock.sendall(message)
+                return True
+            
+            # Assemble length prefix and data in a pooled buffer for a single write
+            payload = message.to_bytes()
+            size = len(payload) + HEADER_SIZE
+            buf = self._acquire_buffer(size)
+            try:
+                buf[:HEADER_SIZE] = pack_header(len(payload))
+                buf[HEADER_SIZE:size] = payload
+                with memoryview(buf) as view:
+                    sock.sendall(view[:size])
+            finally:
+                self._release_buffer(buf)
             return True
         except Exception as e:
             print(f"Failed to send message: {e}")
@@ -82,37 +201,93 @@ class CameraProtocol:
     
     def receive_message(self, sock: socket.socket) -> Optional[CameraMessage]:
         """Receive a message from socket."""
+        buf = self._acquire_buffer(HEADER_SIZE)
         try:
             # Receive length first
-            length_bytes = self._receive_exact(sock, 4)
-            if not length_bytes:
-                return None
+            with memoryview(buf) as view:
+                if not recv_exact_into(sock, view[:HEADER_SIZE]):
+                    return None
             
-            length = int.from_bytes(length_bytes, byteorder='big')
-            if length > self.config.BUFFER_SIZE:
+            length = unpack_header(buf)
+            if length > self.config.MAX_MESSAGE_SIZE:
                 raise ValueError(f"Message too large: {length} bytes")
+            if length > len(buf):
+                self._release_buffer(buf)
+                buf = self._acquire_buffer(length)
             
-            # Receive actual message
-            json_bytes = self._receive_exact(sock, length)
-            if not json_bytes:
-                return None
-            
-            json_str = json_bytes.decode()
-            return CameraMessage.from_json(json_str)
+            # Receive actual message and parse it in place
+            with memoryview(buf) as view:
+                if not recv_exact_into(sock, view[:length]):
+                    return None
+                return CameraMessage.from_bytes(view[:length])
         
         except Exception as e:
             print(f"Failed to receive message: {e}")
             return None
+        finally:
+            self._release_buffer(buf)
+    
+    def decode_frame(self, frame: bytes) -> Optional[CameraMessage]:
+        """Decode one complete frame, e.g. a heartbeat datagram."""
+        try:
+            if len(frame) < HEADER_SIZE or unpack_header(frame) != len(frame) - HEADER_SIZE:
+                raise ValueError(f"Malformed frame of {len(frame)} bytes")
+            return CameraMessage.from_bytes(frame[HEADER_SIZE:])
+        except ValueError as e:
+            print(f"Failed to decode frame: {e}")
+            return None
     
     def _receive_exact(self, sock: socket.socket, size: int) -> Optional[bytes]:
         """Receive exactly 'size' bytes from socket."""
-        data = b''
-        while len(data) < size:
-            chunk = sock.recv(size - len(data))
-            if not chunk:
+        # Fill a preallocated buffer in place rather than concatenating chunks
+        buf = bytearray(size)
+        if not recv_exact_into(sock, memoryview(buf)):
+            return None
+        return bytes(buf)
+    
+    def send_file(self, sock: socket.socket, path: str) -> bool:
+        """Send a file as an 8-byte size prefix followed by its raw bytes."""
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                sock.sendall(size.to_bytes(8, byteorder='big'))
+                # sendfile(2) moves the data kernel-side, no copies through Python.
+                # Bounded to the advertised size so a growing file cannot desync the stream
+                sent = sock.sendfile(f, 0, size)
+            if sent != size:
+                raise ConnectionError(f"File shrank to {sent} of {size} bytes while sending")
+            return True
+        except Exception as e:
+            print(f"Failed to send file {path}: {e}")
+            return False
+    
+    def receive_file(self, sock: socket.socket, path: str) -> Optional[int]:
+        """Receive a file sent by send_file() into 'path'. Returns its size."""
+        created = False
+        try:
+            size_bytes = self._receive_exact(sock, 8)
+            if not size_bytes:
                 return None
-            data += chunk
-        return data
+            size = int.from_bytes(size_bytes, byteorder='big')
+            
+            # Stream to disk through one reused buffer
+            buf = bytearray(self.config.FILE_CHUNK_SIZE)
+            view = memoryview(buf)
+            remaining = size
+            with open(path, 'wb') as f:
+                created = True
+                while remaining:
+                    n = sock.recv_into(view, min(remaining, len(buf)))
+                    if not n:
+                        raise ConnectionError(f"Connection closed with {remaining} bytes left")
+                    f.write(view[:n])
+                    remaining -= n
+            return size
+        except Exception as e:
+            print(f"Failed to receive file {path}: {e}")
+            if created:
+                os.unlink(path)  # Never leave a truncated image behind
+            return None
     
     def create_register_message(self, hostname: str, client_info: Dict[str, Any] = None) -> CameraMessage:
         """Create client registration message."""
@@ -151,24 +326,38 @@ class CameraProtocol:
         """Create error message."""
         return CameraMessage(MessageType.ERROR, {'error': error})
     
-    def create_heartbeat_message(self) -> CameraMessage:
+    def create_send_image_message(self, filename: str) -> CameraMessage:
+        """Create image download command message."""
+        return CameraMessage(MessageType.SEND_IMAGE, {'filename': filename})
+    
+    def create_heartbeat_message(self, hostname: str = None) -> CameraMessage:
         """Create heartbeat message."""
-        return CameraMessage(MessageType.HEARTBEAT)
+        return CameraMessage(MessageType.HEARTBEAT, {'hostname': hostname} if hostname else None)
+    
+    def heartbeat_frame(self, hostname: str) -> bytes:
+        """Get the encoded heartbeat frame for this hostname, encoding it once."""
+        frame = self._heartbeat_frames.get(hostname)
+        if frame is None:
+            frame = self.encode_message(self.create_heartbeat_message(hostname))
+            self._heartbeat_frames[hostname] = frame
+        return frame
 
 
-def connect_with_retry(host: str, port: int, retries: int = 3, timeout: int = 5) -> Optional[socket.socket]:
+def connect_with_retry(host: str, port: int, retries: int = 3, timeout: int = 5,
+                       socket_options: List[Tuple[int, int, int]] = None) -> Optional[socket.socket]:
     """Connect to server with retry logic."""
     for attempt in range(retries):
+        sock = None
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(timeout)
             sock.connect((host, port))
+            configure_socket(sock, socket_options)
             return sock
         except Exception as e:
             print(f"Connection attempt {attempt + 1} failed: {e}")
             if sock:
                 sock.close()
             if attempt < retries - 1:
-                import time
                 time.sleep(1)
     return None
\ No newline at end of file
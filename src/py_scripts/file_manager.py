@@ -5,8 +5,7 @@ Handles image file operations like listing, counting, and deletion.
 """
 
 import os
-import glob
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Tuple
 from pathlib import Path
 
 
@@ -15,44 +14,56 @@ class ImageFileManager:
     
     def __init__(self, base_dir: str = "."):
         self.base_dir = Path(base_dir)
-        self.image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+        # Lower-case extensions; file names are case-folded once when matched,
+        # so IMG_01.JPG and photo.Png are found without per-case scans
+        self.image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
+    
+    def _iter_image_entries(self) -> Iterator[os.DirEntry]:
+        """Yield directory entries of image files in a single directory pass."""
+        try:
+            with os.scandir(self.base_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue  # Skip hidden files, like shell-style globbing
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext in self.image_extensions and entry.is_file():
+                        yield entry
+        except FileNotFoundError:
+            return
+    
+    def iter_images(self) -> Iterator[str]:
+        """Yield image file names lazily, without building a list."""
+        for entry in self._iter_image_entries():
+            yield entry.name
     
     def list_images(self) -> List[str]:
         """List all image files in the directory."""
-        images = []
-        for ext in self.image_extensions:
-            pattern = f"*{ext}"
-            images.extend(glob.glob(str(self.base_dir / pattern)))
-            # Also check uppercase extensions
-            pattern = f"*{ext.upper()}"
-            images.extend(glob.glob(str(self.base_dir / pattern)))
-        
-        # Return just filenames, not full paths
-        return [os.path.basename(img) for img in images]
+        return list(self.iter_images())
     
     def count_images(self) -> int:
         """Count total number of image files."""
-        return len(self.list_images())
+        return sum(1 for _ in self._iter_image_entries())
     
     def get_image_info(self) -> Dict[str, any]:
         """Get detailed information about images."""
-        images = self.list_images()
         total_size = 0
         
+        # Single directory pass; DirEntry.stat() is one stat per file, no exists() check
         file_info = []
-        for img in images:
-            file_path = self.base_dir / img
-            if file_path.exists():
-                size = file_path.stat().st_size
-                total_size += size
-                file_info.append({
-                    'name': img,
-                    'size': size,
-                    'size_mb': round(size / (1024 * 1024), 2)
-                })
+        for entry in self._iter_image_entries():
+            try:
+                size = entry.stat().st_size
+            except FileNotFoundError:
+                continue  # Removed since the scan
+            total_size += size
+            file_info.append({
+                'name': entry.name,
+                'size': size,
+                'size_mb': round(size / (1024 * 1024), 2)
+            })
         
         return {
-            'count': len(images),
+            'count': len(file_info),
             'total_size_bytes': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
             'files': file_info
@@ -60,18 +71,18 @@ class ImageFileManager:
     
     def delete_all_images(self) -> Tuple[int, List[str]]:
         """Delete all image files. Returns (count_deleted, errors)."""
-        images = self.list_images()
         deleted_count = 0
         errors = []
         
-        for img in images:
+        # Unlink straight from the scan; no Path objects or exists() stat per file
+        for entry in self._iter_image_entries():
             try:
-                file_path = self.base_dir / img
-                if file_path.exists():
-                    file_path.unlink()
-                    deleted_count += 1
-            except Exception as e:
-                errors.append(f"Failed to delete {img}: {str(e)}")
+                os.unlink(entry.path)
+                deleted_count += 1
+            except FileNotFoundError:
+                pass  # Removed by someone else since the scan
+            except OSError as e:
+                errors.append(f"Failed to delete {entry.name}: {str(e)}")
         
         return deleted_count, errors
     
@@ -79,16 +90,15 @@ class ImageFileManager:
         """Delete specific image files. Returns (count_deleted, errors)."""
         deleted_count = 0
         errors = []
+        base_dir = str(self.base_dir)
         
         for filename in filenames:
             try:
-                file_path = self.base_dir / filename
-                if file_path.exists():
-                    file_path.unlink()
-                    deleted_count += 1
-                else:
-                    errors.append(f"File not found: {filename}")
-            except Exception as e:
+                os.unlink(os.path.join(base_dir, filename))
+                deleted_count += 1
+            except FileNotFoundError:
+                errors.append(f"File not found: {filename}")
+            except OSError as e:
                 errors.append(f"Failed to delete {filename}: {str(e)}")
         
         return deleted_count, errors
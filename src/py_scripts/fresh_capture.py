@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Shared picamera2 helpers for triggered stills.
+Configures the camera for low memory use and hands out only frames
+whose exposure started after the trigger.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Tuple
+
+FRESH_FRAME_TIMEOUT = 1.0  # Seconds to keep skipping stale frames before using what arrives
+
+
+def configure_still(camera: Any, size: Tuple[int, int]) -> None:
+    """Configure a Picamera2 for single fresh stills at 'size'."""
+    # 24bpp RGB888 and a single buffer halve CMA use versus the XRGB8888 default;
+    # queue=False makes each request wait for a fresh frame
+    camera.configure(camera.create_still_configuration(
+        main={"size": size, "format": "RGB888"},
+        buffer_count=1,
+        queue=False
+    ))
+
+
+@contextmanager
+def fresh_request(camera: Any) -> Iterator[Any]:
+    """Yield the first completed request whose exposure started after this call."""
+    # SensorTimestamp is on the kernel monotonic clock, like monotonic_ns()
+    requested_ns = time.monotonic_ns()
+    deadline = time.monotonic() + FRESH_FRAME_TIMEOUT
+    request = camera.capture_request()
+    try:
+        # Skip a frame already in flight when the command arrived
+        while (request.get_metadata().get("SensorTimestamp", requested_ns) < requested_ns
+               and time.monotonic() < deadline):
+            request.release()
+            request = None
+            request = camera.capture_request()
+        yield request
+    finally:
+        if request is not None:
+            request.release()
@@ -4,22 +4,62 @@ HQ Camera Client - Raspberry Pi camera client with server registration.
 Automatically registers with server and handles camera operations.
 """
 
+import asyncio
+import itertools
+import select
+import selectors
 import socket
 import subprocess
 import threading
 import time
 import os
 import sys
-from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 import signal
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None  # Fall back to spawning libcamera-still per capture
 
 # Import our modules
-from camera_protocol import CameraProtocol, MessageType, ProtocolConfig, connect_with_retry
+from camera_protocol import (CAPTURE_TIMESTAMP_FORMAT, CameraProtocol, MessageType, ProtocolConfig,
+                             configure_socket, connect_with_retry, is_capture_timestamp)
 from file_manager import ImageFileManager
+from fresh_capture import configure_still, fresh_request
 from s3_uploader import get_default_s3_uploader
 
 
+@dataclass(slots=True)
+class CmdResult:
+    """Outcome of a command, sent back as a RESPONSE message."""
+    status: str
+    message: str
+    data: Optional[Dict[str, Any]] = None
+
+
+def run_spawned(cmd: List[str], timeout: float) -> None:
+    """Run a command via posix_spawn, raising like subprocess.run(check=True, timeout=...)."""
+    # vfork-style spawn skips duplicating the page tables of this large process
+    pid = os.posix_spawnp(cmd[0], cmd, os.environ)
+    pidfd = os.pidfd_open(pid)
+    try:
+        # The pidfd becomes readable when the child exits
+        if not select.select([pidfd], [], [], timeout)[0]:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+    finally:
+        os.close(pidfd)
+    
+    _, status = os.waitpid(pid, 0)
+    returncode = os.waitstatus_to_exitcode(status)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
 class CameraClient:
     """HQ Camera client for Raspberry Pi."""
     
@@ -28,144 +68,155 @@ class CameraClient:
         self.server_port = server_port
         self.client_port = client_port
         self.hostname = socket.gethostname()
+        self._log_prefix = f"[{self.hostname}]"  # Fixed, so formatted once
         
         self.protocol = CameraProtocol()
         self.file_manager = ImageFileManager()
         self.s3_uploader = get_default_s3_uploader()
+        self.picam2 = self._open_camera()
         
         self.running = False
         self.client_socket = None
+        self.heartbeat_socket = None
         self.registration_thread = None
         self.heartbeat_thread = None
+        self._stop_event = threading.Event()  # Set on shutdown, wakes timed waits at once
+        # Commands may arrive on several connections; run them one at a time
+        self.command_lock = threading.Lock()
+        # Persistent server connections are few, so a small bounded pool serves them
+        self._conn_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cmd")
+        self._connections = set()  # Open server connections, closed on shutdown
+        self._connections_lock = threading.Lock()
         
         print(f"Camera Client [{self.hostname}] initialized")
         print(f"   Server: {server_host}:{server_port}")
         print(f"   Client port: {client_port}")
     
-    def capture_image(self, timestamp: str) -> dict:
-        """Execute libcamera-still to capture an image."""
+    def _open_camera(self) -> Optional["Picamera2"]:
+        """Start the camera once so captures skip pipeline start-up."""
+        if Picamera2 is None:
+            return None
+        try:
+            picam2 = Picamera2()
+            configure_still(picam2, (4056, 3040))
+            picam2.start()
+            return picam2
+        except Exception as e:
+            print(f"WARNING [{self.hostname}] Camera open failed, using libcamera-still: {e}")
+            return None
+    
+    def _capture_fresh(self, filename: str) -> None:
+        """Save the first frame whose exposure started after this call."""
+        with fresh_request(self.picam2) as request:
+            request.save("main", filename)
+    
+    def capture_image(self, timestamp: str) -> CmdResult:
+        """Capture an image with the warm camera, or libcamera-still without picamera2."""
         filename = f"{timestamp}.png"
         
-        # Build command - high quality capture with specific timestamp filename
-        cmd: List[str] = [
-            "libcamera-still",
-            "-n",              # No preview
-            "-t", "1",         # Capture immediately  
-            "--width", "4056",
-            "--height", "3040",
-            "-e", "png",       # PNG for high quality
-            "-o", filename,
-            "--immediate"      # Immediate capture without delay
-        ]
-        
         try:
-            print(f"[{self.hostname}] Capturing: {filename}")
-            start_time = datetime.now()
+            print(self._log_prefix, "Capturing:", filename)
+            start_time = time.monotonic()
             
-            # Execute capture command
-            result = subprocess.run(cmd, check=True, timeout=15, 
-                                  capture_output=False, text=True)
+            if self.picam2:
+                self._capture_fresh(filename)
+            else:
+                # Build command - high quality capture with specific timestamp filename
+                cmd: List[str] = [
+                    "libcamera-still",
+                    "-n",              # No preview
+                    "-t", "1",         # Capture immediately  
+                    "--width", "4056",
+                    "--height", "3040",
+                    "-e", "png",       # PNG for high quality
+                    "-o", filename,
+                    "--immediate"      # Immediate capture without delay
+                ]
+                
+                # Execute capture command
+                run_spawned(cmd, timeout=15)
             
-            end_time = datetime.now()
-            duration = (end_time - start_time).total_seconds()
+            duration = time.monotonic() - start_time
             
             # Verify file was created
             if os.path.exists(filename):
                 file_size = os.path.getsize(filename)
-                print(f"[{self.hostname}] Capture completed in {duration:.2f}s ({file_size} bytes)")
-                return {
-                    'status': 'SUCCESS',
-                    'message': f"Captured {filename}",
-                    'data': {
-                        'filename': filename,
-                        'duration': duration,
-                        'size_bytes': file_size
-                    }
-                }
+                print(self._log_prefix, f"Capture completed in {duration:.2f}s ({file_size} bytes)")
+                return CmdResult('SUCCESS', f"Captured {filename}", {
+                    'filename': filename,
+                    'duration': duration,
+                    'size_bytes': file_size
+                })
             else:
-                return {
-                    'status': 'ERROR',
-                    'message': 'Image file not created'
-                }
+                return CmdResult('ERROR', 'Image file not created')
                 
         except subprocess.TimeoutExpired:
-            return {
-                'status': 'ERROR',
-                'message': 'Capture timeout after 15s'
-            }
+            return CmdResult('ERROR', 'Capture timeout after 15s')
         except subprocess.CalledProcessError as e:
-            return {
-                'status': 'ERROR', 
-                'message': f'Capture failed with code {e.returncode}'
-            }
+            return CmdResult('ERROR', f'Capture failed with code {e.returncode}')
         except Exception as e:
-            return {
-                'status': 'ERROR',
-                'message': str(e)
-            }
+            return CmdResult('ERROR', str(e))
     
-    def list_images(self) -> dict:
+    def list_images(self) -> CmdResult:
         """List all captured images."""
         try:
             image_info = self.file_manager.get_image_info()
             print(f"[{self.hostname}] Found {image_info['count']} images ({image_info['total_size_mb']:.2f} MB)")
             
-            return {
-                'status': 'SUCCESS',
-                'message': f"Found {image_info['count']} images",
-                'data': image_info
-            }
+            return CmdResult('SUCCESS', f"Found {image_info['count']} images", image_info)
         except Exception as e:
-            return {
-                'status': 'ERROR',
-                'message': str(e)
-            }
+            return CmdResult('ERROR', str(e))
+    
+    def image_path(self, filename: str) -> Optional[str]:
+        """Resolve a requested image name to a local image file, or None."""
+        # Only bare names from list_images() are served, never arbitrary paths
+        name = os.path.basename(filename or '')
+        if os.path.splitext(name)[1].lower() not in self.file_manager.image_extensions:
+            return None
+        path = os.path.join(self.file_manager.base_dir, name)
+        return path if os.path.isfile(path) else None
     
-    def upload_to_s3(self, bucket_name: str) -> dict:
+    def upload_to_s3(self, bucket_name: str) -> CmdResult:
         """Upload all images to S3."""
         try:
             # Check S3 credentials
             if not self.s3_uploader.check_credentials():
-                return {
-                    'status': 'ERROR',
-                    'message': 'No valid AWS credentials found'
-                }
+                return CmdResult('ERROR', 'No valid AWS credentials found')
             
-            # Get list of images
-            images = self.file_manager.list_images()
-            if not images:
-                return {
-                    'status': 'SUCCESS',
-                    'message': 'No images to upload',
-                    'data': {'uploaded_count': 0, 'errors': []}
-                }
+            # Stream image names from the directory scan; peek so an empty directory
+            # returns before a bucket is created
+            images = self.file_manager.iter_images()
+            first = next(images, None)
+            if first is None:
+                return CmdResult('SUCCESS', 'No images to upload', {'uploaded_count': 0, 'errors': []})
             
-            print(f"[{self.hostname}] Uploading {len(images)} images to {bucket_name}")
+            total_count = 0
+            
+            def counted() -> Iterator[str]:
+                nonlocal total_count
+                for image in itertools.chain((first,), images):
+                    total_count += 1
+                    yield image
+            
+            print(f"[{self.hostname}] Uploading images to {bucket_name}")
             
             # Upload with hostname prefix
-            success_count, errors = self.s3_uploader.upload_images(
-                images, bucket_name, hostname_prefix=self.hostname
-            )
+            success_count, errors = asyncio.run(self.s3_uploader.upload_images_async(
+                counted(), bucket_name, hostname_prefix=self.hostname
+            ))
             
-            print(f"[{self.hostname}] Uploaded {success_count}/{len(images)} images")
+            print(f"[{self.hostname}] Uploaded {success_count}/{total_count} images")
             
-            return {
-                'status': 'SUCCESS',
-                'message': f"Uploaded {success_count} images",
-                'data': {
-                    'uploaded_count': success_count,
-                    'total_count': len(images),
-                    'errors': errors
-                }
-            }
+            return CmdResult('SUCCESS', f"Uploaded {success_count} images", {
+                'uploaded_count': success_count,
+                'total_count': total_count,
+                'errors': errors
+            })
             
         except Exception as e:
-            return {
-                'status': 'ERROR',
-                'message': str(e)
-            }
+            return CmdResult('ERROR', str(e))
     
-    def delete_images(self) -> dict:
+    def delete_images(self) -> CmdResult:
         """Delete all captured images."""
         try:
             deleted_count, errors = self.file_manager.delete_all_images()
@@ -174,51 +225,62 @@ class CameraClient:
             if errors:
                 print(f"   WARNING: {len(errors)} errors occurred")
             
-            return {
-                'status': 'SUCCESS',
-                'message': f"Deleted {deleted_count} images",
-                'data': {
-                    'deleted_count': deleted_count,
-                    'errors': errors
-                }
-            }
+            return CmdResult('SUCCESS', f"Deleted {deleted_count} images", {
+                'deleted_count': deleted_count,
+                'errors': errors
+            })
             
         except Exception as e:
-            return {
-                'status': 'ERROR',
-                'message': str(e)
-            }
+            return CmdResult('ERROR', str(e))
     
     def handle_command(self, conn: socket.socket, message) -> None:
         """Handle incoming command from server."""
         try:
-            response_data = {'status': 'ERROR', 'message': 'Unknown command'}
+            result = CmdResult('ERROR', 'Unknown command')
+            attachment = None  # File streamed after a successful response
             
             if message.type == MessageType.CAPTURE:
-                timestamp = message.data.get('timestamp', datetime.now().strftime("%Y%m%d_%H%M%S"))
-                response_data = self.capture_image(timestamp)
+                timestamp = message.data.get('timestamp') or time.strftime(CAPTURE_TIMESTAMP_FORMAT)
+                # The timestamp becomes the filename, so it must never carry a path
+                if is_capture_timestamp(timestamp):
+                    result = self.capture_image(timestamp)
+                else:
+                    result = CmdResult('ERROR', 'Invalid timestamp')
                 
             elif message.type == MessageType.LIST_IMAGES:
-                response_data = self.list_images()
+                result = self.list_images()
                 
             elif message.type == MessageType.UPLOAD_S3:
                 bucket_name = message.data.get('bucket_name')
                 if bucket_name:
-                    response_data = self.upload_to_s3(bucket_name)
+                    result = self.upload_to_s3(bucket_name)
                 else:
-                    response_data = {'status': 'ERROR', 'message': 'No bucket name provided'}
+                    result = CmdResult('ERROR', 'No bucket name provided')
                     
             elif message.type == MessageType.DELETE_IMAGES:
-                response_data = self.delete_images()
+                result = self.delete_images()
+                
+            elif message.type == MessageType.SEND_IMAGE:
+                filename = message.data.get('filename')
+                attachment = self.image_path(filename)
+                if attachment:
+                    result = CmdResult('SUCCESS', f"Sending {filename}", {
+                        'filename': filename,
+                        'size_bytes': os.path.getsize(attachment)
+                    })
+                else:
+                    result = CmdResult('ERROR', f"Image not found: {filename}")
             
             # Send response
-            response = self.protocol.create_response_message(
-                response_data['status'],
-                response_data['message'],
-                response_data.get('data', {})
-            )
+            response = self.protocol.create_response_message(result.status, result.message, result.data)
             self.protocol.send_message(conn, response)
             
+            # File bytes follow the response via sendfile(2), never through a JSON frame
+            if attachment and result.status == 'SUCCESS':
+                if not self.protocol.send_file(conn, attachment):
+                    # The server is mid-transfer, so the stream cannot be resynchronized
+                    conn.shutdown(socket.SHUT_RDWR)
+            
         except Exception as e:
             print(f"ERROR [{self.hostname}] Error handling command: {e}")
             error_response = self.protocol.create_error_message(str(e))
@@ -259,27 +321,43 @@ class CameraClient:
     
     def send_heartbeat(self):
         """Send periodic heartbeat to server."""
-        while self.running:
+        # Fire-and-forget datagrams: no connection setup or response per beat
+        self.heartbeat_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        heartbeat = self.protocol.heartbeat_frame(self.hostname)
+        interval = self.protocol.config.HEARTBEAT_INTERVAL
+        
+        # Beats are scheduled on fixed monotonic deadlines, so send time never adds drift
+        next_beat = time.monotonic() + interval
+        while not self._stop_event.wait(max(0.0, next_beat - time.monotonic())):
+            # Skip beats missed while stalled rather than sending a burst
+            next_beat = max(next_beat + interval, time.monotonic() + 1)
             try:
-                time.sleep(30)  # Send heartbeat every 30 seconds
-                if not self.running:
-                    break
-                
-                sock = connect_with_retry(self.server_host, self.server_port, retries=1, timeout=3)
-                if sock:
-                    heartbeat_msg = self.protocol.create_heartbeat_message()
-                    heartbeat_msg.data['hostname'] = self.hostname
-                    
-                    self.protocol.send_message(sock, heartbeat_msg)
-                    response = self.protocol.receive_message(sock)
-                    sock.close()
-                    
-                    if response and response.data.get('status') == 'SUCCESS':
-                        print(f"[{self.hostname}] Heartbeat sent")
+                self.heartbeat_socket.sendto(heartbeat, (self.server_host, self.server_port))
+                print(self._log_prefix, "Heartbeat sent")
                     
             except Exception as e:
                 print(f"WARNING [{self.hostname}] Heartbeat failed: {e}")
     
+    def serve_connection(self, conn: socket.socket, addr):
+        """Handle commands on a persistent connection until the server closes it."""
+        with self._connections_lock:
+            self._connections.add(conn)
+        # A half-open link from a vanished server must not hold a pool worker forever;
+        # the server redials when it finds the link closed
+        conn.settimeout(self.protocol.config.IDLE_TIMEOUT)
+        try:
+            while self.running:
+                # Receive and handle command
+                message = self.protocol.receive_message(conn)
+                if not message:
+                    break
+                with self.command_lock:
+                    self.handle_command(conn, message)
+        finally:
+            with self._connections_lock:
+                self._connections.discard(conn)
+            conn.close()
+    
     def start_command_server(self):
         """Start server to listen for commands from main server."""
         try:
@@ -288,24 +366,32 @@ class CameraClient:
             self.client_socket.bind(("0.0.0.0", self.client_port))
             self.client_socket.listen(5)
             
+            # Non-blocking listener polled with a timeout, so shutdown never waits on accept()
+            self.client_socket.setblocking(False)
+            sel = selectors.DefaultSelector()
+            sel.register(self.client_socket, selectors.EVENT_READ)
+            
             print(f"[{self.hostname}] Command server listening on port {self.client_port}")
             
             while self.running:
                 try:
-                    conn, addr = self.client_socket.accept()
-                    print(f"[{self.hostname}] Command from {addr[0]}")
+                    if not sel.select(timeout=1.0):
+                        continue
+                    try:
+                        conn, addr = self.client_socket.accept()
+                    except BlockingIOError:
+                        continue  # Connection went away before we accepted it
+                    configure_socket(conn)
+                    print(self._log_prefix, "Command connection from", addr[0])
                     
-                    # Receive and handle command
-                    message = self.protocol.receive_message(conn)
-                    if message:
-                        self.handle_command(conn, message)
-                    
-                    conn.close()
+                    # The server keeps the connection open across commands
+                    self._conn_pool.submit(self.serve_connection, conn, addr)
                     
                 except socket.error:
                     if self.running:
                         print(f"ERROR [{self.hostname}] Command server error")
                     break
+            sel.close()
                     
         except Exception as e:
             print(f"ERROR [{self.hostname}] Failed to start command server: {e}")
@@ -347,9 +433,29 @@ class CameraClient:
         """Shutdown client gracefully."""
         print(f"[{self.hostname}] Shutting down...")
         self.running = False
+        self._stop_event.set()
         
         if self.client_socket:
             self.client_socket.close()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join(timeout=1)
+        if self.heartbeat_socket:
+            self.heartbeat_socket.close()
+        
+        # Unblock workers waiting on idle persistent connections
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self._conn_pool.shutdown(wait=False, cancel_futures=True)
+        self.s3_uploader.close()
+        
+        if self.picam2:
+            with self.command_lock:
+                self.picam2.close()
+            self.picam2 = None
         
         print(f"[{self.hostname}] Client shutdown complete")
 
@@ -2,19 +2,26 @@
 """
 HQ Camera Server - Controls multiple Raspberry Pi camera clients.
 Provides dynamic client discovery and menu-driven operations.
+Captures can also be triggered remotely by sending a CAPTURE message
+to the discovery port.
 """
 
+import select
+import selectors
+import signal
 import socket
 import threading
 import time
 import os
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 import sys
 
 # Import our modules
-from camera_protocol import CameraProtocol, MessageType, ProtocolConfig
+from camera_protocol import (CAPTURE_TIMESTAMP_FORMAT, CameraMessage, CameraProtocol, MessageType,
+                             ProtocolConfig, configure_socket, is_capture_timestamp)
 from s3_uploader import get_default_s3_uploader
 
 
@@ -24,13 +31,25 @@ class ClientInfo:
     hostname: str
     address: str
     port: int
-    last_seen: datetime
+    last_seen: float  # time.monotonic() of the last registration or heartbeat
     status: str = "connected"
     
     def __str__(self):
         return f"{self.hostname} ({self.address}:{self.port}) - {self.status}"
 
 
+@dataclass
+class ClientLink:
+    """Persistent command connection to a client; the lock serializes exchanges."""
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    sock: Optional[socket.socket] = None
+    
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
 class CameraServer:
     """HQ Camera server for managing multiple Pi clients."""
     
@@ -42,11 +61,45 @@ class CameraServer:
         self.protocol = CameraProtocol()
         self.running = False
         self.server_socket = None
+        self.heartbeat_socket = None  # UDP, shares the discovery port number
         
-        # Server discovery thread
+        # Server discovery and heartbeat threads
         self.discovery_thread = None
+        self.heartbeat_thread = None
         self.status_lock = threading.Lock()
         
+        # Persistent command connections, reused across commands
+        self._conn_pool: Dict[str, ClientLink] = {}  # hostname -> ClientLink
+        self._pool_lock = threading.Lock()
+        
+        # Bounded workers for registration/trigger connections, so a burst of
+        # re-registering clients queues instead of spawning a thread each
+        self._accept_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="disc")
+        
+        # Long-lived workers for fanning commands out to all clients; grown to one per
+        # client so no client's deadline runs while it waits for a free worker
+        self._broadcast_workers = 8
+        self._broadcast_pool = ThreadPoolExecutor(max_workers=self._broadcast_workers,
+                                                  thread_name_prefix="bcast")
+        self._broadcast_pool_lock = threading.Lock()
+        
+        # Main loop waits on stdin and a self-pipe, so signals and housekeeping
+        # are serviced while no command is being typed
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_w, False)
+        self._sel = selectors.DefaultSelector()
+        try:
+            self._sel.register(sys.stdin, selectors.EVENT_READ)
+        except (PermissionError, ValueError):
+            # stdin is a regular file or closed (e.g. under systemd): run headless
+            print("stdin is not interactive, menu disabled")
+        self._sel.register(self._wakeup_r, selectors.EVENT_READ)
+        self._stop_requested = False
+        # stdin is read from the raw fd and split here; a buffered readline() would
+        # swallow later lines that select() then never reports as readable
+        self._stdin_lines: Deque[str] = deque()
+        self._stdin_partial = b""
+        
         print(f"Camera Server initialized on {host}:{port}")
     
     def start_discovery_server(self):
@@ -55,36 +108,53 @@ class CameraServer:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
+            
+            # Heartbeats arrive as datagrams on the same port number, no handshake per beat
+            self.heartbeat_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.heartbeat_socket.bind((self.host, self.port))
+            
             self.server_socket.listen(10)
             self.running = True
             
+            self.heartbeat_thread = threading.Thread(target=self.receive_heartbeats, daemon=True)
+            self.heartbeat_thread.start()
+            
+            # Non-blocking listener polled with a timeout, so shutdown never waits on accept()
+            self.server_socket.setblocking(False)
+            sel = selectors.DefaultSelector()
+            sel.register(self.server_socket, selectors.EVENT_READ)
+            
             print(f"Discovery server listening on {self.host}:{self.port}")
             print("Waiting for client registrations...")
             
             while self.running:
                 try:
-                    conn, addr = self.server_socket.accept()
-                    # Handle each client connection in a separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_client_connection,
-                        args=(conn, addr),
-                        daemon=True
-                    )
-                    client_thread.start()
+                    if not sel.select(timeout=1.0):
+                        continue
+                    try:
+                        conn, addr = self.server_socket.accept()
+                    except BlockingIOError:
+                        continue  # Connection went away before we accepted it
+                    conn.setblocking(True)
+                    # Handle each client connection on a pooled worker
+                    self._accept_pool.submit(self.handle_client_connection, conn, addr)
                     
                 except socket.error:
                     if self.running:
                         print("Server socket error occurred")
                     break
+            sel.close()
                     
         except Exception as e:
             print(f"Failed to start discovery server: {e}")
     
     def handle_client_connection(self, conn: socket.socket, addr: Tuple[str, int]):
-        """Handle a client connection for registration or heartbeat."""
+        """Handle a connection for registration, heartbeat or a remote capture trigger."""
         try:
             # Set timeout for client communication
             conn.settimeout(self.protocol.config.TIMEOUT)
+            # Registration and capture replies are small; send them without Nagle delay
+            configure_socket(conn)
             
             # Receive registration message
             message = self.protocol.receive_message(conn)
@@ -101,10 +171,13 @@ class CameraServer:
                         hostname=hostname,
                         address=addr[0],
                         port=client_port,
-                        last_seen=datetime.now()
+                        last_seen=time.monotonic()
                     )
                     self.client_addresses[hostname] = (addr[0], client_port)
                 
+                # A (re-)registered client gets a fresh command connection
+                self._evict_conn(hostname)
+                
                 # Send acknowledgment
                 response = self.protocol.create_response_message("SUCCESS", "Registered successfully")
                 self.protocol.send_message(conn, response)
@@ -112,97 +185,223 @@ class CameraServer:
                 print(f"Client registered: {hostname} at {addr[0]}:{client_port}")
                 
             elif message.type == MessageType.HEARTBEAT:
-                hostname = message.data.get('hostname')
-                if hostname and hostname in self.clients:
-                    with self.status_lock:
-                        self.clients[hostname].last_seen = datetime.now()
-                        self.clients[hostname].status = "connected"
-                    
+                # Heartbeats normally come over UDP; TCP ones are still answered
+                if self.record_heartbeat(message.data.get('hostname')):
                     # Send heartbeat response
                     response = self.protocol.create_response_message("SUCCESS", "Heartbeat received")
                     self.protocol.send_message(conn, response)
+            
+            elif message.type == MessageType.CAPTURE:
+                # Remote trigger: fan out to all clients and report their results.
+                # Clients name files after the timestamp, so anything unexpected
+                # is replaced with the server clock
+                timestamp = message.data.get('timestamp')
+                responses = self.capture_images(timestamp if is_capture_timestamp(timestamp) else None)
+                succeeded = sum(1 for r in responses.values() if r['status'] == 'SUCCESS')
+                response = self.protocol.create_response_message(
+                    "SUCCESS" if succeeded == len(responses) else "ERROR",
+                    f"{succeeded}/{len(responses)} clients captured",
+                    {'responses': responses}
+                )
+                self.protocol.send_message(conn, response)
                     
         except Exception as e:
             print(f"Error handling client {addr}: {e}")
         finally:
             conn.close()
     
-    def send_command_to_client(self, hostname: str, message) -> Optional[Dict]:
-        """Send a command to a specific client and get response."""
+    def receive_heartbeats(self):
+        """Receive UDP heartbeat datagrams on a single thread."""
+        while self.running:
+            try:
+                data, addr = self.heartbeat_socket.recvfrom(512)
+            except OSError:
+                if self.running:
+                    print("Heartbeat socket error occurred")
+                break
+            
+            message = self.protocol.decode_frame(data)
+            if message and message.type == MessageType.HEARTBEAT:
+                self.record_heartbeat(message.data.get('hostname'))
+    
+    def record_heartbeat(self, hostname: Optional[str]) -> bool:
+        """Mark a registered client as seen now. Returns False for unknown clients."""
+        with self.status_lock:
+            client = self.clients.get(hostname)
+            if client is None:
+                return False
+            client.last_seen = time.monotonic()
+            client.status = "connected"
+            return True
+    
+    def send_command_to_client(self, hostname: str, message,
+                               receive_path: str = None) -> Optional[Dict]:
+        """Send a command to a specific client and get response.
+        
+        If receive_path is given, a file sent after a successful response
+        is written there.
+        """
         if hostname not in self.client_addresses:
             return {'status': 'ERROR', 'message': f'Client {hostname} not found'}
         
         ip, port = self.client_addresses[hostname]
+        link = self._get_link(hostname)
         
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(self.protocol.config.TIMEOUT)
-                sock.connect((ip, port))
-                
-                # Send command
-                if not self.protocol.send_message(sock, message):
-                    return {'status': 'ERROR', 'message': 'Failed to send command'}
+        with link.lock:
+            try:
+                # A reused connection may have gone stale; retry a failed send once on a new one
+                for attempt in range(2):
+                    reused = link.sock is not None
+                    sock = self._get_conn(link, ip, port)
+                    
+                    # Send command
+                    if self.protocol.send_message(sock, message):
+                        break
+                    link.close()
+                    if not reused or attempt:
+                        return {'status': 'ERROR', 'message': 'Failed to send command'}
                 
                 # Receive response
                 response = self.protocol.receive_message(sock)
                 if response:
+                    if receive_path and response.data.get('status') == 'SUCCESS':
+                        if self.protocol.receive_file(sock, receive_path) is None:
+                            link.close()
+                            return {'status': 'ERROR', 'message': 'File transfer failed'}
                     return response.data
                 else:
+                    # Stream position is unknown after a failed receive
+                    link.close()
                     return {'status': 'ERROR', 'message': 'No response received'}
                     
-        except Exception as e:
-            with self.status_lock:
-                if hostname in self.clients:
-                    self.clients[hostname].status = "disconnected"
-            return {'status': 'ERROR', 'message': str(e)}
-    
-    def broadcast_command(self, message) -> Dict[str, Dict]:
-        """Send command to all clients and collect responses."""
-        results = {}
-        threads = []
-        responses = {}
+            except Exception as e:
+                link.close()
+                with self.status_lock:
+                    if hostname in self.clients:
+                        self.clients[hostname].status = "disconnected"
+                return {'status': 'ERROR', 'message': str(e)}
+    
+    def _get_link(self, hostname: str) -> ClientLink:
+        """Get the pooled link for a client, creating an empty one if needed."""
+        with self._pool_lock:
+            link = self._conn_pool.get(hostname)
+            if link is None:
+                link = self._conn_pool[hostname] = ClientLink()
+            return link
+    
+    def _get_conn(self, link: ClientLink, ip: str, port: int) -> socket.socket:
+        """Return the link's open socket, dialing the client if needed. Caller holds link.lock."""
+        if link.sock is not None:
+            # Idle link should have nothing to read; EOF or stray data means it is unusable
+            readable, _, _ = select.select([link.sock], [], [], 0)
+            if not readable:
+                return link.sock
+            link.close()
         
-        def send_to_client(hostname):
-            responses[hostname] = self.send_command_to_client(hostname, message)
+        sock = socket.create_connection((ip, port), timeout=self.protocol.config.TIMEOUT)
+        configure_socket(sock)
+        link.sock = sock
+        return sock
+    
+    def _evict_conn(self, hostname: str):
+        """Close and forget the pooled connection to a client."""
+        with self._pool_lock:
+            link = self._conn_pool.pop(hostname, None)
+        if link:
+            with link.lock:
+                link.close()
+    
+    def _abandon_conn(self, hostname: str):
+        """Forget a client's pooled connection while a worker may still be using it."""
+        with self._pool_lock:
+            link = self._conn_pool.pop(hostname, None)
+        # link.lock is held by the stuck worker; shutting the socket down wakes it
+        # and frees its pool slot, and the next command dials a new connection
+        sock = link.sock if link else None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    def _broadcast_executor(self, jobs: int) -> ThreadPoolExecutor:
+        """Get the broadcast pool, replacing it with a larger one if 'jobs' would queue."""
+        with self._broadcast_pool_lock:
+            if jobs > self._broadcast_workers:
+                # Work already submitted finishes on the old pool's threads
+                old_pool = self._broadcast_pool
+                self._broadcast_workers = jobs
+                self._broadcast_pool = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="bcast")
+                old_pool.shutdown(wait=False)
+            return self._broadcast_pool
+    
+    def broadcast_command(self, message,
+                          on_response: Callable[[str, Dict], None] = None) -> Dict[str, Dict]:
+        """Send command to all clients and collect responses.
+        
+        on_response, if given, is called with (hostname, response) as each
+        response arrives rather than after the slowest client.
+        """
+        # Encode once and send the same frame to every client
+        if isinstance(message, CameraMessage):
+            message = self.protocol.encode_message(message)
         
         # Send to all clients in parallel
-        for hostname in list(self.clients.keys()):
-            thread = threading.Thread(target=send_to_client, args=(hostname,))
-            threads.append(thread)
-            thread.start()
+        hostnames = list(self.clients.keys())
+        pool = self._broadcast_executor(len(hostnames))
+        futures = {
+            pool.submit(self.send_command_to_client, hostname, message): hostname
+            for hostname in hostnames
+        }
         
-        # Wait for all responses
-        for thread in threads:
-            thread.join()
+        # Collect responses as they land, but never wait longer than connect + receive timeouts
+        timeout = self.protocol.config.TIMEOUT * 2
+        responses = {}
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                hostname = futures[future]
+                responses[hostname] = future.result()
+                if on_response:
+                    on_response(hostname, responses[hostname])
+        except FuturesTimeoutError:
+            for future, hostname in futures.items():
+                if hostname not in responses:
+                    # A job still running holds the link; drop it so the stale reply
+                    # is never read as the answer to a later command
+                    if not future.cancel():
+                        self._abandon_conn(hostname)
+                    responses[hostname] = {'status': 'ERROR', 'message': f'No response within {timeout}s'}
+                    if on_response:
+                        on_response(hostname, responses[hostname])
         
         return responses
     
-    def capture_images(self):
+    def capture_images(self, timestamp: str = None) -> Dict[str, Dict]:
         """Command all clients to capture images."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = timestamp or time.strftime(CAPTURE_TIMESTAMP_FORMAT)
         capture_msg = self.protocol.create_capture_message(timestamp)
         
         print(f"\nBroadcasting capture command at {timestamp}")
         print("-" * 50)
         
-        responses = self.broadcast_command(capture_msg)
-        
-        for hostname, response in responses.items():
+        def report(hostname, response):
             if response['status'] == 'SUCCESS':
                 print(f"SUCCESS {hostname}: {response.get('message', 'Capture successful')}")
             else:
                 print(f"ERROR {hostname}: {response.get('message', 'Capture failed')}")
         
+        # Print each client's result as soon as it arrives
+        responses = self.broadcast_command(capture_msg, on_response=report)
+        
         print("-" * 50)
+        return responses
     
     def list_client_images(self):
         """Get image list and count from all clients."""
-        list_msg = self.protocol.create_list_images_message()
-        
         print(f"\nListing images from all clients")
         print("-" * 60)
         
-        responses = self.broadcast_command(list_msg)
+        responses = self.broadcast_command(self.protocol.list_images_frame)
         
         total_images = 0
         for hostname, response in responses.items():
@@ -230,10 +429,58 @@ class CameraServer:
         print(f"Total images across all clients: {total_images}")
         print("-" * 60)
     
+    def fetch_image(self, hostname: str, filename: str, dest_dir: str = "fetched") -> Dict:
+        """Download one image from a client into dest_dir/<hostname>/."""
+        client_dir = os.path.join(dest_dir, hostname)
+        os.makedirs(client_dir, exist_ok=True)
+        message = self.protocol.create_send_image_message(filename)
+        return self.send_command_to_client(
+            hostname, message, receive_path=os.path.join(client_dir, os.path.basename(filename))
+        )
+    
+    def fetch_client_images(self):
+        """Download every image from all clients."""
+        print("\nFetching images from all clients")
+        print("-" * 60)
+        
+        def fetch_all(hostname: str, files: List[Dict]) -> Tuple[int, List[str]]:
+            fetched, errors = 0, []
+            for file_info in files:
+                response = self.fetch_image(hostname, file_info['name'])
+                if response['status'] == 'SUCCESS':
+                    fetched += 1
+                else:
+                    errors.append(f"{file_info['name']}: {response.get('message')}")
+            return fetched, errors
+        
+        # Clients transfer in parallel; each client's files go one at a time on its link
+        listings = self.broadcast_command(self.protocol.list_images_frame)
+        pool = self._broadcast_executor(len(listings))
+        futures = {
+            pool.submit(fetch_all, hostname, response.get('data', {}).get('files', [])): hostname
+            for hostname, response in listings.items() if response['status'] == 'SUCCESS'
+        }
+        
+        total_fetched = 0
+        for future in as_completed(futures):
+            hostname = futures[future]
+            fetched, errors = future.result()
+            print(f"Client {hostname}: fetched {fetched} images")
+            for error in errors:
+                print(f"   ERROR {error}")
+            total_fetched += fetched
+        
+        for hostname, response in listings.items():
+            if response['status'] != 'SUCCESS':
+                print(f"ERROR {hostname}: {response.get('message', 'Failed to list images')}")
+        
+        print(f"\nTotal images fetched: {total_fetched}")
+        print("-" * 60)
+    
     def upload_to_s3(self):
         """Command all clients to upload images to S3."""
         # Create bucket name with timestamp
-        timestamp = datetime.now().strftime("%Y-%m%d-%H%M")
+        timestamp = time.strftime("%Y-%m%d-%H%M")
         bucket_name = f"camera-captures-{timestamp}"
         
         upload_msg = self.protocol.create_upload_s3_message(bucket_name)
@@ -265,17 +512,15 @@ class CameraServer:
     def delete_client_images(self):
         """Command all clients to delete their images after confirmation."""
         # Get confirmation
-        confirmation = input("\nWARNING: Are you sure you want to delete ALL images from ALL clients? (Y/n): ")
-        if confirmation.lower() not in ['y', 'yes', '']:
+        confirmation = self._input("\nWARNING: Are you sure you want to delete ALL images from ALL clients? (Y/n): ")
+        if confirmation is None or confirmation.strip().lower() not in ['y', 'yes', '']:
             print("Delete operation cancelled.")
             return
         
-        delete_msg = self.protocol.create_delete_images_message()
-        
         print(f"\nDeleting all images from clients")
         print("-" * 50)
         
-        responses = self.broadcast_command(delete_msg)
+        responses = self.broadcast_command(self.protocol.delete_images_frame)
         
         total_deleted = 0
         for hostname, response in responses.items():
@@ -294,6 +539,27 @@ class CameraServer:
         print(f"\nTotal images deleted: {total_deleted}")
         print("-" * 50)
     
+    def _refresh_status(self, client: ClientInfo, now: float) -> float:
+        """Update a client's status from its last heartbeat. Returns seconds since then."""
+        time_diff = now - client.last_seen
+        if time_diff > 60:  # More than 1 minute
+            client.status = "disconnected"
+        elif time_diff > 30:  # More than 30 seconds
+            client.status = "timeout"
+        else:
+            client.status = "connected"
+        return time_diff
+    
+    def sweep_clients(self):
+        """Refresh every client's status, reporting clients that have gone offline."""
+        with self.status_lock:
+            now = time.monotonic()
+            for client in self.clients.values():
+                was_disconnected = client.status == "disconnected"
+                self._refresh_status(client, now)
+                if client.status == "disconnected" and not was_disconnected:
+                    print(f"\nWARNING {client.hostname} missed heartbeats, marked offline")
+    
     def show_client_status(self):
         """Display current client status."""
         with self.status_lock:
@@ -304,17 +570,9 @@ class CameraServer:
             print(f"\nConnected Clients ({len(self.clients)}):")
             print("-" * 60)
             
-            current_time = datetime.now()
+            current_time = time.monotonic()
             for hostname, client in self.clients.items():
-                time_diff = (current_time - client.last_seen).total_seconds()
-                
-                # Update status based on last seen time
-                if time_diff > 60:  # More than 1 minute
-                    client.status = "disconnected"
-                elif time_diff > 30:  # More than 30 seconds
-                    client.status = "timeout"
-                else:
-                    client.status = "connected"
+                time_diff = self._refresh_status(client, current_time)
                 
                 status_prefix = {
                     "connected": "[ONLINE]",
@@ -336,6 +594,7 @@ class CameraServer:
         print("Commands:")
         print("  [1] Capture images on all clients")
         print("  [2] List images from all clients") 
+        print("  [f] Fetch images from all clients")
         print("  [9] Upload images to S3")
         print("  [0] Delete all images (with confirmation)")
         print("  [s] Show client status")
@@ -354,37 +613,102 @@ class CameraServer:
         self.show_client_status()
         
         try:
-            while True:
-                command = input("\nEnter command: ").strip().lower()
+            self._prompt()
+            while not self._stop_requested:
+                events = self._sel.select(timeout=5)
+                if not events:
+                    # Idle: housekeeping only
+                    self.sweep_clients()
+                    continue
                 
-                if command == '1':
-                    self.capture_images()
-                elif command == '2':
-                    self.list_client_images()
-                elif command == '9':
-                    self.upload_to_s3()
-                elif command == '0':
-                    self.delete_client_images()
-                elif command == 's':
-                    self.show_client_status()
-                elif command == 'h':
-                    self.show_menu()
-                elif command in ['q', 'quit']:
-                    print("\nShutting down server...")
-                    break
-                else:
-                    print("Unknown command. Press 'h' for help.")
+                for key, _ in events:
+                    if key.fileobj is sys.stdin:
+                        stdin_open = self._read_stdin()
+                        while self._stdin_lines and not self._stop_requested:
+                            if self.handle_command(self._stdin_lines.popleft().strip().lower()):
+                                self._prompt()
+                            else:
+                                self._stop_requested = True
+                        if not stdin_open:
+                            self._stop_requested = True
+                    else:
+                        os.read(self._wakeup_r, 512)
+            print("\nShutting down server...")
         
         except KeyboardInterrupt:
             print("\n\nServer interrupted by user")
         finally:
             self.shutdown()
     
+    def _prompt(self):
+        """Show the command prompt without ending the line."""
+        print("\nEnter command: ", end="", flush=True)
+    
+    def _read_stdin(self) -> bool:
+        """Queue the complete lines now readable on stdin. Returns False once stdin is closed."""
+        chunk = os.read(sys.stdin.fileno(), 4096)
+        if not chunk:
+            # A last line without a newline still counts
+            if self._stdin_partial:
+                self._stdin_lines.append(self._stdin_partial.decode(errors='replace'))
+                self._stdin_partial = b""
+            return False
+        *lines, self._stdin_partial = (self._stdin_partial + chunk).split(b"\n")
+        self._stdin_lines.extend(line.decode(errors='replace') for line in lines)
+        return True
+    
+    def _input(self, prompt: str) -> Optional[str]:
+        """Like input(), but shares the main loop's stdin queue. Returns None at end of input."""
+        print(prompt, end="", flush=True)
+        while not self._stdin_lines:
+            if not self._read_stdin() and not self._stdin_lines:
+                return None
+        return self._stdin_lines.popleft()
+    
+    def handle_command(self, command: str) -> bool:
+        """Run one menu command. Returns False when the server should quit."""
+        if command == '1':
+            self.capture_images()
+        elif command == '2':
+            self.list_client_images()
+        elif command == 'f':
+            self.fetch_client_images()
+        elif command == '9':
+            self.upload_to_s3()
+        elif command == '0':
+            self.delete_client_images()
+        elif command == 's':
+            self.show_client_status()
+        elif command == 'h':
+            self.show_menu()
+        elif command in ['q', 'quit']:
+            return False
+        else:
+            print("Unknown command. Press 'h' for help.")
+        return True
+    
+    def request_stop(self):
+        """Ask the main loop to exit; safe to call from a signal handler."""
+        self._stop_requested = True
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except BlockingIOError:
+            pass  # Pipe already holds a wakeup
+    
     def shutdown(self):
         """Shutdown the server gracefully."""
         self.running = False
         if self.server_socket:
             self.server_socket.close()
+        if self.heartbeat_socket:
+            self.heartbeat_socket.close()
+        self._accept_pool.shutdown(wait=False, cancel_futures=True)
+        self._broadcast_pool.shutdown(wait=False, cancel_futures=True)
+        for hostname in list(self._conn_pool):
+            self._evict_conn(hostname)
+        self._sel.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
         print("Server shutdown complete")
 
 
@@ -399,6 +723,9 @@ def main():
             print("Invalid port number. Using default 8888.")
     
     server = CameraServer(port=port)
+    
+    # Leave the main loop cleanly on SIGTERM, e.g. from systemd
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.request_stop())
     server.run()
 
 
@@ -1,73 +1,252 @@
 #!/usr/bin/env python3
 
+import asyncio
+import io
+import os
+import select
 import socket
 import subprocess
 import threading
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None  # Fall back to a warm libcamera-vid MJPEG stream
+
+from camera_protocol import is_capture_timestamp
+from fresh_capture import configure_still, fresh_request
+
 # Client configuration
 CLIENT_HOST = '0.0.0.0'  # Listen on all interfaces
 CLIENT_PORT = 8889
-BUFFER_SIZE = 1024
+BUFFER_SIZE = 1024  # Longest command line accepted
 CLIENT_NAME = 'pizero1'
+CAPTURE_WORKERS = 1  # The sensor is exclusive, so captures run one at a time
+IDLE_TIMEOUT = 300  # Seconds an idle persistent connection is kept open
+LISTEN_BACKLOG = 128  # Room for bursts of connections from several servers
+# Fixed SO_RCVBUF/SO_SNDBUF in bytes, e.g. 262144. 0 keeps kernel auto-tuning,
+# which an explicit size would disable (raise net.ipv4.tcp_rmem instead).
+SOCKET_BUFFER_SIZE = 0
+CAPTURE_SIZE = (1920, 1080)
+JPEG_QUALITY = 75
+CAPTURE_TIMEOUT = 15  # Seconds to wait for a frame
+
+# Used when picamera2 is unavailable - fastest settings for Pi Zero
+MJPEG_CMD: List[str] = [
+    "libcamera-vid",
+    "-n",                 # No preview
+    "-t", "0",            # Run until stopped
+    "--codec", "mjpeg",   # Every frame is a complete JPEG
+    "--width", "1920",
+    "--height", "1080",
+    "--framerate", "5",
+    "-q", "75",           # Lower quality for speed
+    "--flush",            # Write each frame out as soon as it is encoded
+    "-o", "-"             # Frames to stdout
+]
+
+# Command protocol works on bytes to skip per-command decode/encode.
+# Commands and responses are newline-terminated lines, e.g. b"CAPTURE:20250101_120000\n",
+# so back-to-back commands on one connection never merge or split.
+CAPTURE_PREFIX = b"CAPTURE:"
+UNKNOWN_COMMAND_RESPONSE = b"ERROR:Unknown command\n"
+INVALID_TIMESTAMP_RESPONSE = b"ERROR:Invalid timestamp\n"
+
+JPEG_SOI = b"\xff\xd8"  # JPEG start-of-image marker
+JPEG_EOI = b"\xff\xd9"  # JPEG end-of-image marker
+
+# Camera is opened once and kept running; the lock serializes sensor access
+_camera = None
+_stream = None
+_camera_lock = threading.Lock()
+
+
+class MjpegStream:
+    """Persistent libcamera-vid process handing out single JPEG frames."""
+    
+    def __init__(self, cmd: List[str]):
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
+        self._fd = self.proc.stdout.fileno()
+        self._buffer = bytearray()
+    
+    def _read_chunk(self, deadline: float) -> None:
+        """Append the next chunk of stream output to the buffer."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([self._fd], [], [], remaining)[0]:
+            raise TimeoutError(f"Capture timeout after {CAPTURE_TIMEOUT}s")
+        chunk = self.proc.stdout.read(65536)
+        if not chunk:
+            raise RuntimeError("libcamera-vid stream ended")
+        self._buffer += chunk
+    
+    def _discard_pending(self) -> None:
+        """Drop frames already buffered so the next frame is exposed after the request."""
+        self._buffer.clear()
+        while select.select([self._fd], [], [], 0)[0]:
+            if not self.proc.stdout.read(65536):
+                break
+    
+    def capture_frame(self) -> bytes:
+        """Return the next complete JPEG frame from the stream."""
+        self._discard_pending()
+        deadline = time.monotonic() + CAPTURE_TIMEOUT
+        
+        # Skip the partial frame the drain may have cut into
+        while (start := self._buffer.find(JPEG_SOI)) < 0:
+            self._read_chunk(deadline)
+        del self._buffer[:start]
+        
+        while (end := self._buffer.find(JPEG_EOI, len(JPEG_SOI))) < 0:
+            self._read_chunk(deadline)
+        end += len(JPEG_EOI)
+        frame = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return frame
+    
+    def close(self) -> None:
+        """Stop the libcamera-vid process."""
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def get_camera() -> "Picamera2":
+    """Open, configure and start the camera on first use."""
+    global _camera
+    if _camera is None:
+        camera = Picamera2()
+        configure_still(camera, CAPTURE_SIZE)
+        camera.options["quality"] = JPEG_QUALITY
+        camera.start()
+        _camera = camera
+    return _camera
+
+
+def capture_fresh(camera: "Picamera2") -> bytes:
+    """Encode the first frame whose exposure started after this call as JPEG."""
+    jpeg = io.BytesIO()
+    with fresh_request(camera) as request:
+        request.save("main", jpeg, format="jpeg")
+    return jpeg.getvalue()
+
+
+def write_image(filename: str, data: bytes) -> None:
+    """Write an encoded image straight to its file descriptor."""
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def get_stream() -> MjpegStream:
+    """Start the MJPEG stream on first use, restarting it if it has died."""
+    global _stream
+    if _stream is None or _stream.proc.poll() is not None:
+        _stream = MjpegStream(MJPEG_CMD)
+    return _stream
+
+
+def close_camera() -> None:
+    """Release the camera or stop the MJPEG stream, whichever is open."""
+    with _camera_lock:
+        if _camera is not None:
+            _camera.close()
+        if _stream is not None:
+            _stream.close()
 
 
 def capture_image(timestamp: str) -> str:
-    """Execute libcamera-still to capture an image."""
+    """Capture an image with picamera2, or the warm MJPEG stream if unavailable."""
     filename = f"{CLIENT_NAME}_{timestamp}.jpg"
     
-    # Build command - using fastest settings for Pi Zero
-    cmd: List[str] = [
-        "libcamera-still",
-        "-n",              # No preview
-        "-t", "1",         # Capture immediately
-        "--width", "1920",
-        "--height", "1080",
-        "-e", "jpg",       # JPEG for faster processing
-        "-q", "75",        # Lower quality for speed
-        "-o", filename
-    ]
-    
     try:
         print(f"[{CLIENT_NAME}] Capturing image: {filename}")
-        start_time = datetime.now()
-        # Don't capture output - let libcamera write directly to console
-        result = subprocess.run(cmd, check=True, timeout=15)
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
+        start_time = time.perf_counter()
+        with _camera_lock:
+            if Picamera2 is not None:
+                frame = capture_fresh(get_camera())
+            else:
+                frame = get_stream().capture_frame()
+        # Frame is already in memory; the sensor is free while it is written
+        write_image(filename, frame)
+        duration = time.perf_counter() - start_time
         print(f"[{CLIENT_NAME}] Capture completed in {duration:.2f}s")
         return f"SUCCESS:{filename}:{duration:.2f}s"
-    except subprocess.TimeoutExpired:
-        return f"ERROR:Capture timeout after 15s"
-    except subprocess.CalledProcessError as e:
-        return f"ERROR:Capture failed with code {e.returncode}"
     except Exception as e:
         return f"ERROR:{str(e)}"
 
 
-def handle_client(conn: socket.socket, addr: tuple) -> None:
-    """Handle incoming connection from server."""
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Serve commands on a connection until the server closes it."""
+    addr = writer.get_extra_info('peername')
+    conn = writer.get_extra_info('socket')
+    # Commands and responses are tiny; disable Nagle to avoid delayed sends
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Detect half-open connections left behind by a rebooted server
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    print(f"[{CLIENT_NAME}] Connection from {addr[0]}:{addr[1]}")
+    
+    loop = asyncio.get_running_loop()
     try:
-        data = conn.recv(BUFFER_SIZE)
-        if not data:
-            return
-        
-        command = data.decode().strip()
-        print(f"[{CLIENT_NAME}] Received command: {command} from {addr[0]}")
-        
-        if command.startswith("CAPTURE:"):
-            timestamp = command.split(":", 1)[1]
-            response = capture_image(timestamp)
-            conn.sendall(response.encode())
-        else:
-            conn.sendall(b"ERROR:Unknown command")
+        # Keep the connection open so repeated captures skip the TCP handshake
+        while True:
+            line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+            if not line:
+                return
+            
+            command = line.strip()
+            print(f"[{CLIENT_NAME}] Received command: {command.decode(errors='replace')} from {addr[0]}")
+            
+            if command.startswith(CAPTURE_PREFIX):
+                timestamp = command[len(CAPTURE_PREFIX):].decode('ascii', errors='replace')
+                # The timestamp names the output file, so it must never carry a path
+                if not is_capture_timestamp(timestamp):
+                    writer.write(INVALID_TIMESTAMP_RESPONSE)
+                else:
+                    # Blocking capture runs on the executor so other connections keep being served
+                    response = await loop.run_in_executor(None, capture_image, timestamp)
+                    writer.write(response.encode() + b"\n")
+            else:
+                writer.write(UNKNOWN_COMMAND_RESPONSE)
+            await writer.drain()
     
+    except asyncio.TimeoutError:
+        print(f"[{CLIENT_NAME}] Closing idle connection from {addr[0]}")
     except Exception as e:
         print(f"[{CLIENT_NAME}] Error handling connection: {e}")
-        conn.sendall(f"ERROR:{str(e)}".encode())
+        writer.write(f"ERROR:{str(e)}\n".encode())
     finally:
-        conn.close()
+        writer.close()
+
+
+async def serve() -> None:
+    """Accept server connections on the event loop until cancelled."""
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=CAPTURE_WORKERS, thread_name_prefix="cap"))
+    
+    server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        # Lets several accept processes share the port, balanced by the kernel
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if SOCKET_BUFFER_SIZE:
+        # Set before listen() so accepted sockets inherit it and the window scale fits
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    server_sock.bind((CLIENT_HOST, CLIENT_PORT))
+    
+    server = await asyncio.start_server(handle_client, sock=server_sock, backlog=LISTEN_BACKLOG,
+                                        limit=BUFFER_SIZE)
+    async with server:
+        await server.serve_forever()
 
 
 def main() -> None:
@@ -75,27 +254,13 @@ def main() -> None:
     print(f"[{CLIENT_NAME}] Client started on {CLIENT_HOST}:{CLIENT_PORT}")
     print(f"[{CLIENT_NAME}] Waiting for commands...")
     
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_sock:
-        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_sock.bind((CLIENT_HOST, CLIENT_PORT))
-        server_sock.listen(5)
-        
-        while True:
-            try:
-                conn, addr = server_sock.accept()
-                print(f"[{CLIENT_NAME}] Connection from {addr[0]}:{addr[1]}")
-                
-                # Handle each connection in a new thread
-                thread = threading.Thread(target=handle_client, args=(conn, addr))
-                thread.daemon = True
-                thread.start()
-                
-            except KeyboardInterrupt:
-                print(f"\n[{CLIENT_NAME}] Shutting down...")
-                break
-            except Exception as e:
-                print(f"[{CLIENT_NAME}] Server error: {e}")
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(f"\n[{CLIENT_NAME}] Shutting down...")
+    finally:
+        close_camera()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
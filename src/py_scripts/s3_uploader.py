@@ -4,43 +4,154 @@ S3 upload module for camera system.
 Handles uploading images to AWS S3 buckets.
 """
 
+import asyncio
 import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
 import boto3
-from typing import List, Dict, Tuple, Optional
-from pathlib import Path
-from botocore.exceptions import ClientError, NoCredentialsError
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Iterable, Iterator, List, Dict, Tuple, Optional
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from s3transfer.manager import TransferManager
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+try:
+    import aioboto3
+except ImportError:
+    aioboto3 = None  # upload_images_async falls back to the threaded uploader
+
+try:
+    import awscrt  # noqa: F401  Lets create_transfer_manager() pick the C-native CRT client
+    from s3transfer.crt import CRTTransferManager
+except ImportError:
+    awscrt = None  # Transfers use the Python TransferManager
+    CRTTransferManager = None
+
+
+UPLOAD_WORKERS = 8  # Files uploaded at once
+PART_SIZE = 8 * 1024 * 1024
+PART_CONCURRENCY = 8  # Parts of one file in flight at once
+
+ASYNC_UPLOAD_LIMIT = 16  # Files in flight on the event loop at once
+
+# Client creation loads service models and resolves credentials, so each
+# distinct configuration gets one (client, credentials found) pair shared by every S3Uploader
+_CLIENT_CACHE: Dict[Tuple, Tuple[Any, bool]] = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+
+def _read_file(path: str) -> bytes:
+    """Read a whole file, for single-request uploads from the event loop."""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _get_client(region: str, aws_access_key: Optional[str], aws_secret_key: Optional[str],
+                config: Config) -> Tuple[Any, bool]:
+    """
+    Get the shared S3 client for this region, key pair and pool size.
+    Also returns whether the credential chain found any credentials.
+    """
+    key = (region, aws_access_key, aws_secret_key, config.max_pool_connections)
+    with _CLIENT_CACHE_LOCK:
+        cached = _CLIENT_CACHE.get(key)
+        if cached is None:
+            # None keys fall through to the default credential chain
+            session = boto3.session.Session(
+                aws_access_key_id=aws_access_key,
+                aws_secret_access_key=aws_secret_key,
+                region_name=region
+            )
+            # Resolved locally (env, config files, instance metadata); nothing is validated with AWS
+            has_credentials = session.get_credentials() is not None
+            cached = _CLIENT_CACHE[key] = (session.client('s3', config=config), has_credentials)
+        return cached
 
 
 class S3Uploader:
     """Handles S3 upload operations for image files."""
     
-    def __init__(self, aws_access_key: str = None, aws_secret_key: str = None, region: str = 'us-east-1'):
+    def __init__(self, aws_access_key: str = None, aws_secret_key: str = None, region: str = 'us-east-1',
+                 max_concurrency: int = PART_CONCURRENCY):
         """
         Initialize S3 uploader.
         If keys are None, will use AWS credentials from environment or AWS config.
+        max_concurrency is the number of parts of a single file uploaded at once.
         """
-        try:
-            if aws_access_key and aws_secret_key:
-                self.s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=aws_access_key,
-                    aws_secret_access_key=aws_secret_key,
-                    region_name=region
-                )
-            else:
-                # Use default credential chain (env vars, ~/.aws/credentials, IAM roles, etc.)
-                self.s3_client = boto3.client('s3', region_name=region)
-            
-            self.region = region
-            self.credentials_available = True
-            
-        except NoCredentialsError:
+        # Full-resolution PNGs exceed PART_SIZE, so each one is also sent as parallel parts
+        self._transfer_config = TransferConfig(
+            multipart_threshold=PART_SIZE,
+            multipart_chunksize=PART_SIZE,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+        # One pooled HTTPS connection per in-flight part, so transfers never queue for
+        # a connection and TLS sessions are reused across files
+        self._client_config = Config(max_pool_connections=UPLOAD_WORKERS * max_concurrency)
+        
+        # Buckets confirmed to exist, so repeat batches skip the head_bucket round trip
+        self._known_buckets = set()
+        
+        # Kept for the aioboto3 session, which builds its own client
+        self._session_kwargs = {'region_name': region}
+        self._aio_session = None  # Created on the first async batch
+        if aws_access_key and aws_secret_key:
+            self._session_kwargs.update(aws_access_key_id=aws_access_key,
+                                        aws_secret_access_key=aws_secret_key)
+        
+        if aws_access_key and aws_secret_key:
+            self.s3_client, self.credentials_available = _get_client(
+                region, aws_access_key, aws_secret_key, self._client_config)
+        else:
+            # Use default credential chain (env vars, ~/.aws/credentials, IAM roles, etc.)
+            self.s3_client, self.credentials_available = _get_client(
+                region, None, None, self._client_config)
+        self.region = region
+        
+        if not self.credentials_available:
             print("Warning: No AWS credentials found. S3 operations will fail.")
             self.s3_client = None
-            self.credentials_available = False
+        
+        # One transfer manager for every multipart upload, so its part workers
+        # persist across files instead of being started per upload_file() call
+        self._transfer_manager = None
+        self._use_crt = False
+        if self.s3_client:
+            self._transfer_manager, self._use_crt = self._create_transfer_manager(max_concurrency)
+    
+    def _create_transfer_manager(self, max_concurrency: int) -> Tuple[Any, bool]:
+        """
+        Create the CRT transfer manager when awscrt is usable, whose I/O never
+        takes the GIL, otherwise the Python TransferManager.
+        Returns (manager, is_crt).
+        """
+        if awscrt is not None:
+            try:
+                # CRT rejects the thread-pool options (use_threads etc.), so it gets its own config
+                crt_config = TransferConfig(
+                    multipart_threshold=PART_SIZE,
+                    multipart_chunksize=PART_SIZE,
+                    max_concurrency=max_concurrency,
+                    preferred_transfer_client='crt'
+                )
+                manager = create_transfer_manager(self.s3_client, crt_config)
+                if isinstance(manager, CRTTransferManager):
+                    return manager, True
+                manager.shutdown()
+            except Exception as e:
+                print(f"Warning: CRT transfer client unavailable, using the Python transfer manager: {e}")
+        return TransferManager(self.s3_client, config=self._transfer_config), False
     
     def check_credentials(self) -> bool:
-        """Check if AWS credentials are available and valid."""
+        """Check if AWS credentials are available, without contacting AWS."""
+        return self.credentials_available
+    
+    def verify_credentials(self) -> bool:
+        """Check that AWS accepts the credentials; costs one list_buckets round trip."""
         if not self.credentials_available:
             return False
         
@@ -58,11 +169,15 @@ class S3Uploader:
             print("Error: No AWS credentials available")
             return False
         
+        if bucket_name in self._known_buckets:
+            return True
+        
         try:
             # Check if bucket already exists
             try:
                 self.s3_client.head_bucket(Bucket=bucket_name)
                 print(f"Bucket {bucket_name} already exists")
+                self._known_buckets.add(bucket_name)
                 return True
             except ClientError as e:
                 error_code = e.response['Error']['Code']
@@ -81,12 +196,14 @@ class S3Uploader:
                 )
             
             print(f"Created bucket: {bucket_name}")
+            self._known_buckets.add(bucket_name)
             return True
             
         except ClientError as e:
             error_code = e.response['Error']['Code']
             if error_code == 'BucketAlreadyOwnedByYou':
                 print(f"Bucket {bucket_name} already owned by you")
+                self._known_buckets.add(bucket_name)
                 return True
             else:
                 print(f"Failed to create bucket {bucket_name}: {e}")
@@ -95,24 +212,33 @@ class S3Uploader:
             print(f"Unexpected error creating bucket: {e}")
             return False
     
-    def upload_file(self, local_file_path: str, bucket_name: str, s3_key: str = None) -> bool:
-        """Upload a single file to S3."""
+    def upload_file(self, local_file_path: str, bucket_name: str, s3_key: str = None,
+                    size: int = None) -> bool:
+        """Upload a single file to S3. Pass size if already known to skip a stat."""
         if not self.credentials_available:
             print("Error: No AWS credentials available")
             return False
         
         try:
-            file_path = Path(local_file_path)
-            if not file_path.exists():
-                print(f"File not found: {local_file_path}")
-                return False
+            file_name = os.path.basename(local_file_path)
+            if size is None:
+                try:
+                    size = os.stat(local_file_path).st_size
+                except FileNotFoundError:
+                    print(f"File not found: {local_file_path}")
+                    return False
             
             # Use filename as S3 key if not provided
             if s3_key is None:
-                s3_key = file_path.name
+                s3_key = file_name
             
-            self.s3_client.upload_file(str(file_path), bucket_name, s3_key)
-            print(f"Uploaded {file_path.name} to s3://{bucket_name}/{s3_key}")
+            if size < PART_SIZE and not self._use_crt:
+                # Single-request objects skip the transfer manager's queue and thread hand-off
+                with open(local_file_path, 'rb') as f:
+                    self.s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=f)
+            else:
+                self._transfer_manager.upload(local_file_path, bucket_name, s3_key).result()
+            print(f"Uploaded {file_name} to s3://{bucket_name}/{s3_key}")
             return True
             
         except ClientError as e:
@@ -122,12 +248,60 @@ class S3Uploader:
             print(f"Unexpected error uploading file: {e}")
             return False
     
-    def upload_images(self, image_files: List[str], bucket_name: str, 
+    def upload_images(self, image_files: Iterable[str], bucket_name: str, 
                      hostname_prefix: str = None, base_dir: str = ".") -> Tuple[int, List[str]]:
         """
         Upload multiple image files to S3.
         Returns (success_count, error_list).
+        
+        Hands the whole batch to the CRT transfer manager when awscrt is
+        installed. Otherwise runs upload_images_async() on a private event loop
+        when aioboto3 is installed, so must not be called from a running loop;
+        failing both, uploads with a thread pool.
         """
+        if self._use_crt:
+            return self._upload_images_crt(image_files, bucket_name, hostname_prefix, base_dir)
+        if aioboto3 is not None:
+            return asyncio.run(self.upload_images_async(image_files, bucket_name,
+                                                        hostname_prefix, base_dir))
+        return self._upload_images_threaded(image_files, bucket_name, hostname_prefix, base_dir)
+    
+    def _resolve_jobs(self, image_files: Iterable[str], hostname_prefix: str = None,
+                      base_dir: str = ".") -> Tuple[List[Tuple[str, str, str, int]], List[str]]:
+        """Resolve images to (image, local path, S3 key, size) jobs, reporting missing or empty files."""
+        errors = []
+        # Plain string joins per file instead of Path arithmetic
+        base_str, sep = str(base_dir), os.sep
+        prefix = f"{hostname_prefix}/" if hostname_prefix else ""
+        
+        # One directory pass; DirEntry caches the file type and its first stat()
+        try:
+            with os.scandir(base_str) as it:
+                entries = {entry.name: entry for entry in it if entry.is_file()}
+        except FileNotFoundError:
+            entries = {}
+        
+        # Resolve every (image, local path, S3 key, size) up front so missing or
+        # empty files never reach an upload, and a pool can be sized to the batch
+        jobs = []
+        for image_file in image_files:
+            entry = entries.get(image_file)
+            local_path = entry.path if entry else base_str + sep + image_file
+            try:
+                # Names with a subdirectory are not in the scan; stat them directly
+                size = entry.stat().st_size if entry else os.stat(local_path).st_size
+            except FileNotFoundError:
+                errors.append(f"File not found: {image_file}")
+                continue
+            if not size:
+                errors.append(f"Skipped empty file: {image_file}")
+                continue
+            jobs.append((image_file, local_path, prefix + image_file, size))
+        return jobs, errors
+    
+    def _upload_images_threaded(self, image_files: Iterable[str], bucket_name: str,
+                                hostname_prefix: str = None, base_dir: str = ".") -> Tuple[int, List[str]]:
+        """Upload multiple image files to S3 from a thread pool sharing one client."""
         if not self.credentials_available:
             return 0, ["No AWS credentials available"]
         
@@ -136,45 +310,188 @@ class S3Uploader:
             return 0, [f"Failed to create/access bucket {bucket_name}"]
         
         success_count = 0
-        errors = []
-        base_path = Path(base_dir)
+        jobs, errors = self._resolve_jobs(image_files, hostname_prefix, base_dir)
+        if not jobs:
+            return 0, errors
         
-        for image_file in image_files:
+        def drain(done: Iterable[Future]) -> None:
+            nonlocal success_count
+            for future in done:
+                image_file = inflight.pop(future)
+                try:
+                    if future.result():
+                        success_count += 1
+                    else:
+                        errors.append(f"Failed to upload {image_file}")
+                except Exception as e:
+                    errors.append(f"Error uploading {image_file}: {str(e)}")
+        
+        # The boto3 client is thread-safe, so all workers share self.s3_client
+        workers = min(UPLOAD_WORKERS, len(jobs))
+        inflight: Dict[Future, str] = {}  # future -> image file
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3") as pool:
+            # Refill a worker as soon as any upload finishes, so one slow request
+            # never holds back the rest of the batch
+            for image_file, local_path, s3_key, size in jobs:
+                if len(inflight) >= workers:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    drain(done)
+                inflight[pool.submit(self.upload_file, local_path, bucket_name, s3_key, size)] = image_file
+            drain(list(wait(inflight).done))
+        
+        return success_count, errors
+    
+    def _upload_images_crt(self, image_files: Iterable[str], bucket_name: str,
+                           hostname_prefix: str = None, base_dir: str = ".") -> Tuple[int, List[str]]:
+        """Upload multiple image files to S3 through the CRT transfer manager."""
+        if not self.credentials_available:
+            return 0, ["No AWS credentials available"]
+        
+        # Ensure bucket exists
+        if not self.create_bucket(bucket_name):
+            return 0, [f"Failed to create/access bucket {bucket_name}"]
+        
+        success_count = 0
+        jobs, errors = self._resolve_jobs(image_files, hostname_prefix, base_dir)
+        
+        # Submit the whole batch at once; the CRT client schedules the requests and
+        # moves the bytes on native threads, so no Python pool is needed
+        futures = [(image_file, s3_key, self._transfer_manager.upload(local_path, bucket_name, s3_key))
+                   for image_file, local_path, s3_key, _ in jobs]
+        for image_file, s3_key, future in futures:
             try:
-                local_path = base_path / image_file
-                
-                # Create S3 key with hostname prefix if provided
-                if hostname_prefix:
-                    s3_key = f"{hostname_prefix}/{image_file}"
-                else:
-                    s3_key = image_file
-                
-                if self.upload_file(str(local_path), bucket_name, s3_key):
-                    success_count += 1
-                else:
-                    errors.append(f"Failed to upload {image_file}")
-                    
+                future.result()
+                print(f"Uploaded {image_file} to s3://{bucket_name}/{s3_key}")
+                success_count += 1
             except Exception as e:
                 errors.append(f"Error uploading {image_file}: {str(e)}")
         
         return success_count, errors
     
+    async def upload_images_async(self, image_files: Iterable[str], bucket_name: str,
+                                  hostname_prefix: str = None, base_dir: str = ".") -> Tuple[int, List[str]]:
+        """
+        Upload multiple image files to S3 from a single event loop.
+        Returns (success_count, error_list), like upload_images().
+        The CRT transfer manager is preferred when it is in use.
+        """
+        if self._use_crt:
+            return await asyncio.to_thread(self._upload_images_crt, image_files, bucket_name,
+                                           hostname_prefix, base_dir)
+        if aioboto3 is None:
+            return await asyncio.to_thread(self._upload_images_threaded, image_files, bucket_name,
+                                           hostname_prefix, base_dir)
+        
+        if not self.credentials_available:
+            return 0, ["No AWS credentials available"]
+        
+        # Ensure bucket exists
+        if not await asyncio.to_thread(self.create_bucket, bucket_name):
+            return 0, [f"Failed to create/access bucket {bucket_name}"]
+        
+        # Same pre-filter as the threaded path; image_files may be a one-shot
+        # generator, so it is consumed exactly once here
+        jobs, errors = await asyncio.to_thread(self._resolve_jobs, image_files, hostname_prefix, base_dir)
+        if not jobs:
+            return 0, errors
+        
+        semaphore = asyncio.Semaphore(ASYNC_UPLOAD_LIMIT)
+        if self._aio_session is None:
+            # Built once; clients are per batch because they belong to one event loop
+            self._aio_session = aioboto3.Session(**self._session_kwargs)
+        
+        # One client for every file, so its connections and TLS sessions are shared
+        async with self._aio_session.client('s3', config=self._client_config) as s3_client:
+            async def upload_one(image_file: str, local_path: str, s3_key: str, size: int) -> Optional[str]:
+                """Upload one file; returns an error message on failure."""
+                try:
+                    async with semaphore:
+                        if size < PART_SIZE:
+                            # Single-request objects skip the managed transfer, as in upload_file()
+                            body = await asyncio.to_thread(_read_file, local_path)
+                            await s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=body)
+                        else:
+                            await s3_client.upload_file(local_path, bucket_name, s3_key,
+                                                        Config=self._transfer_config)
+                    print(f"Uploaded {image_file} to s3://{bucket_name}/{s3_key}")
+                    return None
+                except Exception as e:
+                    return f"Error uploading {image_file}: {str(e)}"
+            
+            results = await asyncio.gather(*(upload_one(*job) for job in jobs))
+        
+        upload_errors = [error for error in results if error]
+        return len(results) - len(upload_errors), errors + upload_errors
+    
+    def upload_images_packed(self, image_files: Iterable[str], bucket_name: str,
+                             hostname_prefix: str = None, base_dir: str = ".") -> Tuple[int, List[str]]:
+        """
+        Upload multiple image files to S3 as a single tar object.
+        Returns (packed_count, error_list); unpack with unpack_image_batch().
+        """
+        if not self.credentials_available:
+            return 0, ["No AWS credentials available"]
+        
+        # Ensure bucket exists
+        if not self.create_bucket(bucket_name):
+            return 0, [f"Failed to create/access bucket {bucket_name}"]
+        
+        packed_count = 0
+        # Same pre-filter as the per-file paths, so every mode skips and reports alike
+        jobs, errors = self._resolve_jobs(image_files, hostname_prefix, base_dir)
+        prefix = f"{hostname_prefix}/" if hostname_prefix else ""
+        s3_key = f"{prefix}batch-{time.strftime('%Y%m%d_%H%M%S')}.tar"
+        
+        # Images are already compressed, so a plain tar; spills to disk past one part
+        with tempfile.SpooledTemporaryFile(max_size=PART_SIZE) as spool:
+            with tarfile.open(fileobj=spool, mode='w|') as tar:
+                for image_file, local_path, _, _ in jobs:
+                    try:
+                        tar.add(local_path, arcname=image_file)
+                        packed_count += 1
+                    except FileNotFoundError:
+                        errors.append(f"File not found: {image_file}")
+                    except OSError as e:
+                        # One unreadable file must not abort the rest of the batch
+                        errors.append(f"Error packing {image_file}: {str(e)}")
+            if not packed_count:
+                return 0, errors
+            
+            # One object instead of one request per image
+            spool.seek(0)
+            try:
+                self._transfer_manager.upload(spool, bucket_name, s3_key).result()
+                print(f"Uploaded {packed_count} images to s3://{bucket_name}/{s3_key}")
+            except Exception as e:
+                return 0, errors + [f"Error uploading {s3_key}: {str(e)}"]
+        
+        return packed_count, errors
+    
+    def close(self) -> None:
+        """Stop the transfer manager's worker threads."""
+        if self._transfer_manager:
+            self._transfer_manager.shutdown()
+            self._transfer_manager = None
+    
+    def iter_bucket_keys(self, bucket_name: str, prefix: str = None) -> Iterator[str]:
+        """Yield every key in an S3 bucket, fetching one page at a time."""
+        kwargs = {'Bucket': bucket_name}
+        if prefix:
+            kwargs['Prefix'] = prefix
+        
+        # list_objects_v2 returns at most 1000 keys per call; the paginator follows the continuation token
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**kwargs):
+            for obj in page.get('Contents', ()):
+                yield obj['Key']
+    
     def list_bucket_contents(self, bucket_name: str, prefix: str = None) -> Optional[List[str]]:
         """List contents of S3 bucket."""
         if not self.credentials_available:
             return None
         
         try:
-            kwargs = {'Bucket': bucket_name}
-            if prefix:
-                kwargs['Prefix'] = prefix
-            
-            response = self.s3_client.list_objects_v2(**kwargs)
-            
-            if 'Contents' in response:
-                return [obj['Key'] for obj in response['Contents']]
-            else:
-                return []
+            return list(self.iter_bucket_keys(bucket_name, prefix))
                 
         except ClientError as e:
             print(f"Failed to list bucket contents: {e}")
@@ -184,6 +501,23 @@ class S3Uploader:
             return None
 
 
+def unpack_image_batch(archive_path: str, dest_dir: str = ".") -> List[str]:
+    """
+    Extract the images from an upload_images_packed() archive into dest_dir.
+    Only regular files are written, by base name, so entries cannot escape dest_dir.
+    """
+    extracted = []
+    with tarfile.open(archive_path, mode='r') as tar:
+        for member in tar:
+            name = os.path.basename(member.name)
+            if not member.isfile() or not name:
+                continue
+            with tar.extractfile(member) as src, open(os.path.join(dest_dir, name), 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            extracted.append(name)
+    return extracted
+
+
 def get_default_s3_uploader() -> S3Uploader:
     """Get S3 uploader with default settings (uses environment credentials)."""
     return S3Uploader()
\ No newline at end of file
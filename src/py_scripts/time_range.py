@@ -1,63 +1,114 @@
 #!/usr/bin/env python3
 
+import os
+import shutil
 import subprocess
 import time
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from typing import Tuple
+
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None  # Fall back to spawning libcamera-still
+
+# Resolved once: subprocess only takes the posix_spawn path for a path with a directory
+LIBCAMERA_STILL: str = shutil.which("libcamera-still") or "/usr/bin/libcamera-still"
+
+# Fixed libcamera-still arguments; only "-o <filename>" is added per capture
+CMD_PREFIX: Tuple[str, ...] = (
+    LIBCAMERA_STILL,
+    "-n",
+    "-t",
+    "1",
+    "--width",
+    "1920",
+    "--height",
+    "1080",
+    "-e",
+    "png",
+)
+
+DEBUG: bool = bool(os.environ.get("DEBUG"))  # Echo the command line before running it
+
+# Opened on first capture and reused, so repeat captures skip camera start-up
+_camera = None
+
+
+def get_camera() -> "Picamera2":
+    """Open, configure and start the camera on first use."""
+    global _camera
+    if _camera is None:
+        camera = Picamera2()
+        camera.configure(camera.create_still_configuration(main={"size": (1920, 1080)}))
+        camera.start()
+        _camera = camera
+    return _camera
+
+
+def close_camera() -> None:
+    """Release the camera if it was opened."""
+    global _camera
+    if _camera is not None:
+        _camera.close()
+        _camera = None
 
 
 def capture_image(filename: str) -> None:
     """
-    Capture an image using libcamera-still command.
+    Capture an image.
+
+    Uses the warm picamera2 camera when available, otherwise runs the
+    libcamera-still command.
 
     Args:
         filename: The output filename for the captured image
     """
+    if Picamera2 is not None:
+        print(f"picamera2 capture: {filename}")
+        get_camera().capture_file(filename)
+        return
+
     # Build command
-    cmd: List[str] = [
-        "libcamera-still",
-        "-n",
-        "-t",
-        "1",
-        "--width",
-        "1920",
-        "--height",
-        "1080",
-        "-e",
-        "png",
-        "-o",
-        filename,
-    ]
+    cmd: Tuple[str, ...] = (*CMD_PREFIX, "-o", filename)
 
     # Execute command
-    print(f"execute cmd: {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
+    if DEBUG:
+        print(f"execute cmd: {' '.join(cmd)}")
+    # An absolute executable, close_fds=False and no preexec_fn let CPython use posix_spawn (vfork+exec)
+    subprocess.run(
+        cmd,
+        check=True,
+        close_fds=False,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+    )
 
 
 def calculate_time() -> None:
     """Calculate execution time for image capture."""
-    # Generate timestamp for filename
-    timestamp: str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename: str = f"{timestamp}.png"
-    
-    # Record start time
-    start_time: float = time.time()
-    start_datetime: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    print(f"start_time: {start_datetime}")
+    # One wall-clock reading names the file and stamps the start
+    now: datetime = datetime.now()
+    filename: str = f"{now:%Y%m%d_%H%M%S}.png"
+    print(f"start_time: {now.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
+
+    # perf_counter is monotonic, so NTP adjustments cannot skew the measurement
+    start_time: float = time.perf_counter()
 
     # Capture the image
     capture_image(filename)
 
-    # Record end time
-    end_time: float = time.time()
-    end_datetime: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    print(f"end_time: {end_datetime}")
-
     # Calculate time range
-    time_range: float = end_time - start_time
+    time_range: float = time.perf_counter() - start_time
+    end_datetime: datetime = now + timedelta(seconds=time_range)
+    print(f"end_time: {end_datetime.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
+
     print(f"time_range: {time_range:.3f} seconds")
     print(f"Image saved as: {filename}")
 
 
 if __name__ == "__main__":
-    calculate_time()
+    try:
+        calculate_time()
+    finally:
+        close_camera()
@@ -1,60 +1,210 @@
 #!/usr/bin/env python3
 
+import os
+import shutil
 import subprocess
+import sys
 import time
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None  # Fall back to spawning libcamera-still
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None  # Let picamera2 encode with Pillow instead
+
+# Resolved once: subprocess only takes the posix_spawn path for a path with a directory
+LIBCAMERA_STILL: str = shutil.which("libcamera-still") or "/usr/bin/libcamera-still"
+
+# Fixed libcamera-still arguments - fastest settings; only "-o <filename>" is added per capture
+CMD_PREFIX: Tuple[str, ...] = (
+    LIBCAMERA_STILL,
+    "-n",              # No preview
+    "-t", "1",         # Capture immediately (1ms delay)
+    "--width", "1920",
+    "--height", "1080",
+    "-e", "jpg",       # JPEG format (faster than PNG)
+    "-q", "75",        # Lower quality for faster encoding
+)
+
+DEBUG: bool = bool(os.environ.get("DEBUG"))  # Echo command lines before running them
+
+# Opened on first capture and reused, so repeat captures skip camera start-up
+_camera = None
+
+
+def get_camera() -> "Picamera2":
+    """Open, configure and start the camera on first use."""
+    global _camera
+    if _camera is None:
+        camera = Picamera2()
+        camera.configure(camera.create_still_configuration(main={"size": (1920, 1080)}))
+        camera.options["quality"] = 75  # Lower quality for faster encoding
+        camera.start()
+        _camera = camera
+    return _camera
+
+
+def close_camera() -> None:
+    """Release the camera if it was opened."""
+    global _camera
+    if _camera is not None:
+        _camera.close()
+        _camera = None
+
+
+def save_frame(camera: "Picamera2", filename: str) -> None:
+    """Capture one frame from the running camera as a JPEG file."""
+    if simplejpeg is None:
+        camera.capture_file(filename)
+        return
+    # libjpeg-turbo with the fast DCT encodes far quicker than the Pillow path;
+    # the default BGR888 format is RGB byte order in the array
+    frame = camera.capture_array("main")
+    Path(filename).write_bytes(
+        simplejpeg.encode_jpeg(frame, quality=75, colorspace="RGB", fastdct=True)
+    )
 
 
 def capture_image(filename: str) -> None:
     """
-    Capture an image using libcamera-still command with fastest settings.
+    Capture an image with fastest settings.
+    
+    Uses the warm picamera2 camera when available, otherwise runs the
+    libcamera-still command.
     
     Args:
         filename: The output filename for the captured image
     """
+    if Picamera2 is not None:
+        print(f"picamera2 capture: {filename}")
+        save_frame(get_camera(), filename)
+        return
+    
     # Build command - using fastest settings
+    cmd: Tuple[str, ...] = (*CMD_PREFIX, "-o", filename)
+    
+    # Execute command
+    if DEBUG:
+        print(f"execute cmd: {' '.join(cmd)}")
+    # An absolute executable, close_fds=False and no preexec_fn let CPython use posix_spawn (vfork+exec)
+    subprocess.run(
+        cmd,
+        check=True,
+        close_fds=False,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def capture_burst(count: int, interval_ms: int, pattern: str) -> List[str]:
+    """
+    Capture a burst of frames, paying camera start-up once for the whole burst.
+    
+    Args:
+        count: Number of frames to capture
+        interval_ms: Delay between frames in milliseconds
+        pattern: Output filename pattern with one integer field, e.g. "shot_%04d.jpg"
+    
+    Returns:
+        The filenames written, in capture order
+    """
+    if Picamera2 is not None:
+        camera = get_camera()
+        print(f"picamera2 burst: {count} frames every {interval_ms}ms")
+        frames: List[str] = []
+        next_shot: float = time.perf_counter()
+        for index in range(count):
+            filename: str = pattern % index
+            save_frame(camera, filename)
+            frames.append(filename)
+            if index == count - 1:
+                break  # No wait after the last frame, so it never adds to the burst time
+            next_shot += interval_ms / 1000
+            time.sleep(max(0.0, next_shot - time.perf_counter()))
+        return frames
+    
+    # One libcamera-still process captures the whole burst in timelapse mode
     cmd: List[str] = [
-        "libcamera-still",
+        LIBCAMERA_STILL,
         "-n",              # No preview
-        "-t", "1",         # Capture immediately (1ms delay)
+        "-t", str(count * interval_ms),
+        "--timelapse", str(interval_ms),
+        "--framestart", "0",
         "--width", "1920",
         "--height", "1080",
         "-e", "jpg",       # JPEG format (faster than PNG)
         "-q", "75",        # Lower quality for faster encoding
-        "-o", filename
+        "-o", pattern
     ]
     
-    # Execute command
-    print(f"execute cmd: {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
+    if DEBUG:
+        print(f"execute cmd: {' '.join(cmd)}")
+    # An absolute executable, close_fds=False and no preexec_fn let CPython use posix_spawn (vfork+exec)
+    subprocess.run(
+        cmd,
+        check=True,
+        close_fds=False,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+    )
+    
+    # Timelapse numbering starts at --framestart and has no gaps
+    frames = []
+    while len(frames) < count and os.path.exists(pattern % len(frames)):
+        frames.append(pattern % len(frames))
+    return frames
+
+
+def calculate_time_burst(count: int, interval_ms: int = 100) -> None:
+    """Calculate total and per-frame execution time for a burst capture."""
+    timestamp: str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    pattern: str = f"{timestamp}_%04d.jpg"
+    
+    start_time: float = time.perf_counter()
+    frames: List[str] = capture_burst(count, interval_ms, pattern)
+    time_range: float = time.perf_counter() - start_time
+    
+    print(f"time_range: {time_range:.3f} seconds for {len(frames)} frames")
+    if frames:
+        print(f"per_frame: {time_range / len(frames):.3f} seconds")
+        print(f"Images saved as: {frames[0]} .. {frames[-1]}")
 
 
 def calculate_time() -> None:
     """Calculate execution time for image capture."""
-    # Generate timestamp for filename
-    timestamp: str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename: str = f"{timestamp}.jpg"
+    # One wall-clock reading names the file and stamps the start
+    now: datetime = datetime.now()
+    filename: str = f"{now:%Y%m%d_%H%M%S}.jpg"
+    print(f"start_time: {now.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
     
-    # Record start time
-    start_time: float = time.time()
-    start_datetime: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    print(f"start_time: {start_datetime}")
+    # perf_counter is monotonic, so NTP adjustments cannot skew the measurement
+    start_time: float = time.perf_counter()
     
     capture_image(filename)
     
-    # Record end time
-    end_time: float = time.time()
-    end_datetime: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    print(f"end_time: {end_datetime}")
-    
     # Calculate time range
-    time_range: float = end_time - start_time
-    print(f"time_range: {time_range:.3f} seconds")
+    time_range: float = time.perf_counter() - start_time
+    end_datetime: datetime = now + timedelta(seconds=time_range)
+    print(f"end_time: {end_datetime.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
     
+    print(f"time_range: {time_range:.3f} seconds")
     print(f"Image saved as: {filename}")
 
 
 if __name__ == "__main__":
-    calculate_time()
+    try:
+        # Optional frame count switches to a burst capture
+        if len(sys.argv) > 1:
+            calculate_time_burst(int(sys.argv[1]))
+        else:
+            calculate_time()
+    finally:
+        close_camera()
 